@@ -14,6 +14,9 @@ WIFI_SSID = "YOUR_WIFI_SSID"
 WIFI_PASSWORD = "YOUR_WIFI_PASSWORD"
 WEB_SERVER_PORT = 80
 ENABLE_WEB_SERVER = True
+NTP_SERVER = "pool.ntp.org"
+# Also serve the web UI and live code events (/events) while codes are displayed
+SERVE_IN_NORMAL_MODE = False
 
 def connect_wifi():
     """Connect to WiFi network"""
@@ -37,7 +40,10 @@ def check_boot_mode():
             button.direction = digitalio.Direction.INPUT
             button.pull = digitalio.Pull.UP
             
-            if not button.value:  # Button pressed (active low)
+            pressed = not button.value  # Button pressed (active low)
+            # Release the pin so the display app can use the button
+            button.deinit()
+            if pressed:
                 print("Boot button pressed - starting configuration mode")
                 return "config"
     except:
@@ -66,7 +72,8 @@ def main():
             
             # Start web server for configuration
             from web_server import TOTPWebServer
-            server = TOTPWebServer(WEB_SERVER_PORT)
+            # Uploads are sealed with the vault when TOTP_PASSPHRASE unlocks it
+            server = TOTPWebServer(WEB_SERVER_PORT, passphrase=os.getenv("TOTP_PASSPHRASE"))
             
             # Also start console interface in parallel
             print("Console interface also available via REPL")
@@ -83,13 +90,22 @@ def main():
     else:
         print("Starting TOTP Authenticator...")
         
-        # Optional: Connect to WiFi for time sync
+        # Show codes right away; WiFi and SNTP sync run from the display loop
+        from totp_authenticator import TOTPAuthenticator
+        from cpyota_timesync import TimeSync, BackgroundNetwork
+        clock = TimeSync()
+        # Passphrase for an encrypted config, from settings.toml if set
+        app = TOTPAuthenticator(clock=clock, passphrase=os.getenv("TOTP_PASSPHRASE"))
+        
         if WIFI_SSID and WIFI_PASSWORD:
-            connect_wifi()
+            app.tasks.append(BackgroundNetwork(WIFI_SSID, WIFI_PASSWORD, clock, NTP_SERVER))
+        
+        if ENABLE_WEB_SERVER and SERVE_IN_NORMAL_MODE:
+            from web_server import TOTPWebServer
+            server = TOTPWebServer(WEB_SERVER_PORT, profiler=app.profiler, authenticator=app)
+            if server.start():
+                app.tasks.append(server)
         
-        # Start main TOTP application
-        from totp_authenticator import TOTPAuthenticator
-        app = TOTPAuthenticator()
         app.run()
 
 if __name__ == "__main__":
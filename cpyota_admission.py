@@ -0,0 +1,72 @@
+"""
+Connection admission control for the TOTP web server
+Per-client and server-wide token buckets decide, before a request is read,
+whether a connection is served, refused with 429 or refused with 503
+"""
+import time
+
+# Pre-encoded so rejecting a connection allocates nothing
+RESPONSE_429 = (b"HTTP/1.1 429 Too Many Requests\r\n"
+                b"Retry-After: 2\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+RESPONSE_503 = (b"HTTP/1.1 503 Service Unavailable\r\n"
+                b"Retry-After: 2\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+
+
+class AdmissionControl:
+    """Token buckets per client address plus one for the whole server
+
+    Each client may burst `burst` requests and then `rate` per second; the
+    server as a whole serves at most `global_rate` per second. At most
+    `max_tracked` client buckets are kept, evicting the longest idle.
+    """
+
+    def __init__(self, rate=2.0, burst=6, global_rate=10.0, global_burst=20, max_tracked=16):
+        self.rate = rate
+        self.burst = burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_tracked = max_tracked
+        self.buckets = {}  # address -> [tokens, last refill]
+        self.global_bucket = [global_burst, time.monotonic()]
+        self.stats = {'admitted': 0, 'rate_limited': 0, 'overloaded': 0}
+
+    def take(self, bucket, rate, burst, now):
+        """Refill a bucket for the elapsed time and take a token if one is left"""
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def client_bucket(self, address, now):
+        bucket = self.buckets.get(address)
+        if bucket is None:
+            if len(self.buckets) >= self.max_tracked:
+                idle = min(self.buckets, key=lambda key: self.buckets[key][1])
+                del self.buckets[idle]
+            bucket = [self.burst, now]
+            self.buckets[address] = bucket
+        return bucket
+
+    def admit(self, address):
+        """Return None to serve the connection, or the status code to refuse it with"""
+        now = time.monotonic()
+        if not self.take(self.client_bucket(address, now), self.rate, self.burst, now):
+            self.stats['rate_limited'] += 1
+            return 429
+        if not self.take(self.global_bucket, self.global_rate, self.global_burst, now):
+            self.stats['overloaded'] += 1
+            return 503
+        self.stats['admitted'] += 1
+        return None
+
+    def reject(self, client_socket, status):
+        """Answer without reading the request and close"""
+        try:
+            client_socket.settimeout(0)
+            client_socket.send(RESPONSE_429 if status == 429 else RESPONSE_503)
+        except OSError:
+            pass
+        client_socket.close()
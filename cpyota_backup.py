@@ -0,0 +1,190 @@
+"""
+Streaming, incremental account backups
+A backup is a JSON-lines journal: a header line, then one record per
+account. Later backups append only accounts whose content hash changed,
+plus tombstones for deleted ones. Restore replays the journal line by line.
+Sealed secrets are copied as stored, so they stay encrypted.
+"""
+import os
+import json
+import time
+import binascii
+
+from cpyota_vault import sha256
+
+BACKUP_NAME = "totp_backup.jsonl"
+BACKUP_VERSION = 1
+HASH_SIZE = 8  # bytes of SHA-256 kept per account
+
+
+def backup_dir():
+    """The SD card when one is mounted, otherwise the root filesystem"""
+    try:
+        if "sd" in os.listdir("/"):
+            os.listdir("/sd")
+            return "/sd"
+    except OSError:
+        pass
+    return "/"
+
+
+def backup_path():
+    return backup_dir().rstrip("/") + "/" + BACKUP_NAME
+
+
+def account_key(account):
+    """Stable key for an account: its id, or issuer and name"""
+    if 'id' in account:
+        return account['id']
+    return f"{account.get('issuer', '')}:{account.get('name', '')}"
+
+
+def canonical(value):
+    """JSON text with sorted keys, so the hash does not depend on dict order"""
+    if isinstance(value, dict):
+        return "{" + ",".join(json.dumps(key) + ":" + canonical(value[key])
+                              for key in sorted(value)) + "}"
+    if isinstance(value, list):
+        return "[" + ",".join(canonical(item) for item in value) + "]"
+    return json.dumps(value)
+
+
+def content_hash(account):
+    digest = sha256(canonical(account).encode("utf-8")).digest()
+    return binascii.hexlify(digest[:HASH_SIZE]).decode()
+
+
+def write_line(f, record):
+    f.write(json.dumps(record))
+    f.write("\n")
+
+
+def read_lines(path):
+    """Yield each journal record without loading the whole file
+
+    A line cut short by a reset during an append (no trailing newline, or
+    not valid JSON) is skipped with a warning, so the rest stays restorable.
+    """
+    with open(path, "r") as f:
+        number = 0
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            number += 1
+            text = line.strip()
+            if not text:
+                continue
+            try:
+                if not line.endswith("\n"):
+                    raise ValueError("no trailing newline")
+                record = json.loads(text)
+            except ValueError as e:
+                print(f"Backup: skipping torn line {number} of {path} ({e})")
+                continue
+            yield record
+
+
+def ends_with_newline(path):
+    """False if the journal's last append was cut short"""
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        size = f.tell()
+        if size == 0:
+            return True
+        f.seek(size - 1)
+        return f.read(1) == b"\n"
+
+
+def backed_up_hashes(path):
+    """{key: hash} for the accounts the journal currently holds"""
+    hashes = {}
+    for record in read_lines(path):
+        if 'backup' in record and record.get('kind') == 'full':
+            hashes = {}
+        elif record.get('deleted'):
+            hashes.pop(record['key'], None)
+        elif 'key' in record:
+            hashes[record['key']] = record['h']
+    return hashes
+
+
+def header(kind, vault_header):
+    record = {'backup': BACKUP_VERSION, 'kind': kind, 'time': int(time.time())}
+    if vault_header is not None:
+        record['vault'] = vault_header
+    return record
+
+
+def write_full(accounts, vault_header=None, path=None):
+    """Start a new journal with every account; returns the number written"""
+    path = path or backup_path()
+    with open(path, "w") as f:
+        write_line(f, header('full', vault_header))
+        for account in accounts:
+            write_line(f, {'key': account_key(account), 'h': content_hash(account),
+                           'account': account})
+    return len(accounts)
+
+
+def write_increment(accounts, vault_header=None, path=None):
+    """Append changed and deleted accounts; returns (changed, deleted)
+
+    Starts a full backup when there is no journal yet.
+    """
+    path = path or backup_path()
+    try:
+        previous = backed_up_hashes(path)
+    except (OSError, ValueError):
+        return write_full(accounts, vault_header, path), 0
+
+    changed = []
+    for account in accounts:
+        key = account_key(account)
+        digest = content_hash(account)
+        if previous.pop(key, None) != digest:
+            changed.append((key, digest, account))
+    # Whatever is left was not seen in the current accounts
+    deleted = list(previous)
+    if not changed and not deleted:
+        return 0, 0
+
+    torn = not ends_with_newline(path)
+    with open(path, "a") as f:
+        if torn:
+            # End the cut-short line so it can't swallow the next record
+            f.write("\n")
+        write_line(f, header('increment', vault_header))
+        for key, digest, account in changed:
+            write_line(f, {'key': key, 'h': digest, 'account': account})
+        for key in deleted:
+            write_line(f, {'key': key, 'deleted': True})
+    return len(changed), len(deleted)
+
+
+def restore(path=None):
+    """Replay the journal; returns (accounts, vault header or None)"""
+    path = path or backup_path()
+    accounts = {}
+    order = []
+    vault_header = None
+    for record in read_lines(path):
+        if 'backup' in record:
+            if record['backup'] != BACKUP_VERSION:
+                raise ValueError(f"Unsupported backup version: {record['backup']}")
+            if record.get('kind') == 'full':
+                accounts = {}
+                order = []
+            vault_header = record.get('vault')
+        elif record.get('deleted'):
+            accounts.pop(record['key'], None)
+        else:
+            if record['key'] not in accounts:
+                order.append(record['key'])
+            accounts[record['key']] = record['account']
+    # A key deleted and added again appears twice in order
+    restored = []
+    for key in order:
+        if key in accounts:
+            restored.append(accounts.pop(key))
+    return restored, vault_header
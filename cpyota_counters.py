@@ -0,0 +1,158 @@
+"""
+Wear-aware counter persistence
+HOTP counters live in their own small file, never in the JSON config. Each
+write reserves a look-ahead range per account, so flash is written once per
+RESERVE presses and a crash resumes past any counter that may have been shown.
+A reservation is only taken in memory once its write has succeeded, so a
+counter outside a saved reservation is never shown.
+Usage counts are written in batches; losing the last few on a reset is harmless.
+"""
+import os
+import json
+import time
+
+COUNTER_FILE = "/totp_counters.json"
+RESERVE = 16  # counters reserved per write
+
+USAGE_FILE = "/totp_usage.json"
+USAGE_BATCH = 8  # bumps collected before a write
+USAGE_INTERVAL = 300  # seconds before pending bumps are written anyway
+
+
+def write_json(filename, data):
+    """Write to a temp file and rename it into place"""
+    temp = filename + ".tmp"
+    with open(temp, 'w') as f:
+        json.dump(data, f)
+    try:
+        os.rename(temp, filename)
+    except OSError:
+        # FAT cannot rename over an existing file; the temp copy covers the gap
+        os.remove(filename)
+        os.rename(temp, filename)
+
+
+class CounterStore:
+    def __init__(self, filename=COUNTER_FILE, reserve=RESERVE):
+        self.filename = filename
+        self.reserve = reserve
+        self.current = {}
+        self.reserved = {}
+        self.writes = 0
+        self.load()
+
+    def load(self):
+        """Read reservations; every counter resumes at the end of its reserved range"""
+        self.reserved = {}
+        # A crash between writing and renaming may leave only the temp file
+        for filename in (self.filename, self.filename + ".tmp"):
+            try:
+                with open(filename, 'r') as f:
+                    saved = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for key, value in saved.items():
+                if value > self.reserved.get(key, 0):
+                    self.reserved[key] = value
+        self.current = dict(self.reserved)
+
+    def register(self, accounts):
+        """Set up counters for (key, initial counter, legacy key) with a single write
+
+        The counter about to be displayed is reserved before it is shown.
+        Counters used to be keyed by account name; a counter still stored
+        under its legacy key is carried over, so a new key never restarts
+        it at a lower value. Raises OSError if the write fails; the counters
+        then stay unreserved until a later write succeeds.
+        """
+        current = dict(self.current)
+        reserved = dict(self.reserved)
+        changed = False
+        migrated = set()
+        for key, initial, legacy in accounts:
+            if legacy != key and legacy in current:
+                if current[legacy] > current.get(key, -1):
+                    current[key] = current[legacy]
+                    reserved[key] = max(reserved.get(key, 0), reserved.get(legacy, current[legacy]))
+                migrated.add(legacy)
+                changed = True
+            if key not in current or current[key] < initial:
+                current[key] = initial
+            if current[key] >= reserved.get(key, 0):
+                reserved[key] = current[key] + self.reserve
+                changed = True
+        # Dropped only after every account had the chance to claim them
+        for legacy in migrated:
+            current.pop(legacy, None)
+            reserved.pop(legacy, None)
+        # Showing a higher counter is safe; only the reservation must be durable
+        self.current = current
+        if changed:
+            self.save(reserved)
+
+    def value(self, key, default=0):
+        return self.current.get(key, default)
+
+    def reserved_for(self, key):
+        """True when the current counter lies inside a saved reservation"""
+        return self.current.get(key, 0) < self.reserved.get(key, 0)
+
+    def advance(self, key):
+        """Move to the next counter; writes only when the reservation runs out
+
+        Raises OSError, leaving the counter where it was, if the new
+        reservation can't be written.
+        """
+        counter = self.current.get(key, 0) + 1
+        if counter >= self.reserved.get(key, 0):
+            reserved = dict(self.reserved)
+            reserved[key] = counter + self.reserve
+            self.save(reserved)
+        self.current[key] = counter
+        return counter
+
+    def save(self, reserved):
+        """Write all reservations at once; they are kept only once the file is complete"""
+        write_json(self.filename, reserved)
+        self.reserved = reserved
+        self.writes += 1
+
+
+class UsageStore:
+    """Per-account access counts, persisted in batches from poll()"""
+
+    def __init__(self, filename=USAGE_FILE, batch=USAGE_BATCH, interval=USAGE_INTERVAL):
+        self.filename = filename
+        self.batch = batch
+        self.interval = interval
+        self.counts = {}
+        self.pending = 0
+        self.last_write = time.monotonic()
+        self.writes = 0
+        for filename in (self.filename, self.filename + ".tmp"):
+            try:
+                with open(filename, 'r') as f:
+                    self.counts = json.load(f)
+                break
+            except (OSError, ValueError):
+                continue
+
+    def count(self, key):
+        return self.counts.get(key, 0)
+
+    def bump(self, key):
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.pending += 1
+        return self.counts[key]
+
+    def poll(self):
+        """Write pending bumps once a batch is full or the interval has passed"""
+        if self.pending and (self.pending >= self.batch or
+                             time.monotonic() - self.last_write >= self.interval):
+            self.save()
+
+    def save(self):
+        write_json(self.filename, self.counts)
+        self.pending = 0
+        self.last_write = time.monotonic()
+        self.writes += 1
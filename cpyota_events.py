@@ -0,0 +1,177 @@
+"""
+Server-Sent Events fan-out of live TOTP codes
+Each account's code is computed once per time step and the encoded event
+is shared by every subscriber. A subscriber only holds the newest unsent
+event per account, and one that misses whole steps is dropped rather than
+allowed to hold up the device
+"""
+import json
+import time
+import errno
+
+HEARTBEAT_INTERVAL = 15  # seconds between keep-alive comments
+
+
+class Subscriber:
+    """One open event-stream socket and its unsent events
+
+    The backlog holds at most one event per account (plus a heartbeat), so it
+    is bounded by the account list however slowly the client reads.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.pending = {}  # account id -> newest unsent event
+        self.order = []  # ids in pending, oldest first
+        self.partial = b""  # rest of an event the socket took only part of
+        self.missed = 0  # step batches queued while older events were unsent
+
+    def queue(self, key, data):
+        if key not in self.pending:
+            self.order.append(key)
+        # A newer code replaces an unsent one; the client only needs the latest
+        self.pending[key] = data
+
+    def backlogged(self):
+        return bool(self.partial or self.pending)
+
+    def flush(self):
+        """Send as much as the socket accepts without blocking"""
+        while True:
+            if not self.partial:
+                if not self.order:
+                    self.missed = 0
+                    return
+                self.partial = self.pending.pop(self.order.pop(0))
+            try:
+                sent = self.sock.send(self.partial)
+            except OSError as e:
+                if e.args and e.args[0] == errno.EAGAIN:
+                    return
+                raise
+            if sent is None:
+                sent = len(self.partial)
+            self.partial = self.partial[sent:]
+            if self.partial:
+                return
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class CodeBroadcaster:
+    """Pushes each account's new code to all subscribers at step boundaries
+
+    `source` is a callable returning a list of (id, name, issuer, period,
+    code_at) tuples, where code_at(now) returns the code for that time.
+    """
+
+    def __init__(self, source, time_source=lambda: int(time.time()), max_clients=4, max_missed=2):
+        self.source = source
+        self.time_source = time_source
+        self.max_clients = max_clients
+        self.max_missed = max_missed  # step batches a subscriber may fall behind
+        self.subscribers = []
+        self.accounts = None
+        self.latest = {}  # id -> (event fields, step end)
+        self.next_boundary = 0
+        self.next_heartbeat = 0
+        self.computed = 0
+        self.dropped = 0
+
+    def full(self):
+        return len(self.subscribers) >= self.max_clients
+
+    def subscribe(self, sock):
+        """Adopt a socket whose event-stream headers were already sent"""
+        subscriber = Subscriber(sock)
+        self.subscribers.append(subscriber)
+
+        # Start the new client from cached codes; nothing is recomputed for it
+        now = self.time_source()
+        if self.accounts is None:
+            self.refresh(now)
+        for fields, expires in self.latest.values():
+            subscriber.queue(fields['id'], self.encode(fields, expires, now))
+        self.send(subscriber)
+
+    def refresh(self, now):
+        """Compute codes for every account whose step has rolled over"""
+        if self.accounts is None:
+            self.accounts = self.source()
+            self.latest = {}
+
+        changed = []
+        next_boundary = None
+        for account_id, name, issuer, period, code_at in self.accounts:
+            step = int(now) // period
+            expires = (step + 1) * period
+            cached = self.latest.get(account_id)
+            if cached is None or cached[1] != expires:
+                fields = {'id': account_id, 'name': name, 'issuer': issuer,
+                          'code': code_at(now), 'period': period}
+                self.latest[account_id] = (fields, expires)
+                self.computed += 1
+                changed.append((fields, expires))
+            if next_boundary is None or expires < next_boundary:
+                next_boundary = expires
+
+        self.next_boundary = next_boundary or now + HEARTBEAT_INTERVAL
+        return changed
+
+    def encode(self, fields, expires, now):
+        fields['remaining'] = max(0, expires - int(now))
+        return f"event: code\ndata: {json.dumps(fields)}\n\n".encode('utf-8')
+
+    def poll(self):
+        """Push new codes at step boundaries and keep subscribers flowing"""
+        if not self.subscribers:
+            # Nobody listening: forget cached state rather than compute codes
+            self.accounts = None
+            return
+
+        now = self.time_source()
+        if now >= self.next_boundary:
+            changed = self.refresh(now)
+            if changed:
+                for subscriber in self.subscribers:
+                    if subscriber.backlogged():
+                        subscriber.missed += 1
+            for fields, expires in changed:
+                # Encode once, share the same bytes with every subscriber
+                event = self.encode(fields, expires, now)
+                for subscriber in self.subscribers:
+                    subscriber.queue(fields['id'], event)
+
+        if now >= self.next_heartbeat:
+            self.next_heartbeat = now + HEARTBEAT_INTERVAL
+            for subscriber in self.subscribers:
+                if not subscriber.backlogged():
+                    subscriber.queue(None, b": ping\n\n")
+
+        for subscriber in self.subscribers[:]:
+            self.send(subscriber)
+
+    def send(self, subscriber):
+        """Flush a subscriber, dropping it if it errors or falls too far behind"""
+        try:
+            subscriber.flush()
+            if subscriber.missed <= self.max_missed:
+                return
+            print("Dropping slow event subscriber")
+        except OSError:
+            pass
+        self.drop(subscriber)
+
+    def drop(self, subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+            self.dropped += 1
+        subscriber.close()
+
+    def close(self):
+        for subscriber in self.subscribers[:]:
+            self.drop(subscriber)
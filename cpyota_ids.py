@@ -0,0 +1,30 @@
+"""
+Persistent account ids
+Every account gets a random id once, when it is created or first loaded,
+and every writer stores it. Web syncs, backups and HOTP counters refer to
+accounts by this id, so it must never depend on an account's position.
+"""
+import os
+
+
+def new_account_id(existing):
+    """Random short id not used by another account"""
+    while True:
+        account_id = ''.join(f'{b:02x}' for b in os.urandom(4))
+        if account_id not in existing:
+            return account_id
+
+
+def assign_ids(accounts):
+    """Give every account without a unique id a new one; returns True if any changed"""
+    used = set()
+    changed = False
+    for account in accounts:
+        if not isinstance(account, dict):
+            continue
+        account_id = account.get('id')
+        if not isinstance(account_id, str) or not account_id or account_id in used:
+            account['id'] = new_account_id(used)
+            changed = True
+        used.add(account['id'])
+    return changed
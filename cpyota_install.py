@@ -79,6 +79,17 @@ def install():
     print("- web_server.py (web configuration interface)")
     print("- totp_console.py (console configuration)")
     print("- tftblinky.py (display backlight control)")
+    print("- cpyota_profiler.py (display loop profiler)")
+    print("- cpyota_timesync.py (background WiFi and SNTP time sync)")
+    print("- cpyota_vault.py (encrypted secret storage)")
+    print("- cpyota_events.py (live code event stream)")
+    print("- cpyota_validate.py (upload validation)")
+    print("- cpyota_admission.py (web server rate limiting)")
+    print("- cpyota_otp.py (HMAC-SHA1 backend selection)")
+    print("- cpyota_backup.py (streaming incremental backups)")
+    print("- cpyota_counters.py (HOTP counter and usage persistence)")
+    print("- cpyota_ids.py (persistent account ids)")
+    print("- www/index.html and www/index.html.gz (web interface, built by tools/build_web_asset.py)")
 
 if __name__ == "__main__":
     install()
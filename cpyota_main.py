@@ -11,20 +11,30 @@ from adafruit_display_shapes.rect import Rect
 import json
 import storage
 import os
+import digitalio
 from tftblinky import TFTBlinky
+from cpyota_profiler import PhaseProfiler
+from cpyota_vault import SecretVault, zero
+from cpyota_counters import CounterStore, UsageStore
+from cpyota_ids import assign_ids
 
 # Import our custom TOTP library
 try:
-    from pyotp_circuitpython import TOTP, random_base32
+    from pyotp_circuitpython import random_base32
 except ImportError:
     print("Error: pyotp_circuitpython.py not found!")
     raise
+# Codes come from the fastest HMAC-SHA1 backend that passed its self-test
+from cpyota_otp import TOTP, HOTP
+import cpyota_otp
 
 class TOTPAuthenticator:
-    def __init__(self):
+    def __init__(self, clock=None, passphrase=None):
         self.display = board.DISPLAY
         self.display_group = displayio.Group()
         self.display.show(self.display_group)
+        # Refresh explicitly once a frame is fully rebuilt
+        self.display.auto_refresh = False
         
         # Display properties
         self.width = self.display.width
@@ -37,37 +47,100 @@ class TOTPAuthenticator:
         self.last_update = 0
         self.last_page_change = 0
         self.page_rotation_interval = 15  # seconds
+        self.page_codes = []
+        
+        # Display order sorted by issuer/name, and the first position of each letter
+        self.order = []
+        self.buckets = []
+        self.pinned_until = 0
+        self.pin_timeout = 60  # seconds a pinned page stays before rotation resumes
+        
+        # Most-used accounts first; page one shows the top of this ranking
+        self.ranking = []
+        self.favourite_dwell = 2  # page one stays this many rotation intervals
+        
+        # Optional TimeSync clock and background tasks polled from run()
+        self.clock = clock
+        self.tasks = []
+        
+        # Encrypted secrets are decrypted only while their page is shown
+        self.passphrase = passphrase
+        self.vault = None
+        self.unsealed = []
+        
+        # HOTP counters and usage counts persist outside the config to spare flash
+        self.counters = CounterStore()
+        self.usage = UsageStore()
+        self.tasks.append(self.usage)
         
         # Visual feedback
         self.blinky = TFTBlinky()
         
+        # Boot button: short press advances HOTP or pins the page,
+        # holding it steps through the alphabet
+        self.button = None
+        self.button_down = False
+        self.button_held = False
+        self.press_started = 0
+        self.next_step = 0
+        self.long_press = 0.6  # seconds before a hold starts stepping
+        self.bucket_step = 0.5  # seconds per letter while held
+        if hasattr(board, 'IO0'):
+            try:
+                self.button = digitalio.DigitalInOut(board.IO0)
+                self.button.direction = digitalio.Direction.INPUT
+                self.button.pull = digitalio.Pull.UP
+            except ValueError as e:
+                print(f"Boot button unavailable: {e}")
+        
+        # Per-phase timing (off until enabled from config or REPL)
+        self.profiler = PhaseProfiler()
+        
         # Load configuration
         self.load_config()
         
         # Setup display
+        self.refresh_codes()
         self.setup_display()
+        self.display.refresh()
         
         print(f"TOTP Authenticator initialized with {len(self.accounts)} accounts")
         print(f"Display: {self.width}x{self.height}")
+        print(f"OTP backend: {cpyota_otp.backend_name}")
     
     def load_config(self):
         """Load TOTP accounts from configuration file"""
         config_file = "/totp_config.json"
         temp_file = "/totp_temp.json"
         
+        self.vault = self.open_vault(config_file)
+        
         # Check for temporary config file first (from web interface)
-        if temp_file in os.listdir("/"):
+        pending = temp_file[1:] in os.listdir("/")
+        
+        if pending:
             try:
                 with open(temp_file, 'r') as f:
                     config = json.load(f)
                 
-                # Save to permanent config
-                with open(config_file, 'w') as f:
-                    json.dump(config, f)
-                
-                # Delete temporary file for security
-                os.remove(temp_file)
-                print("Configuration updated from web interface")
+                # The web server seals uploads when the vault is unlocked; seal
+                # anything it could not, or refuse to keep it in plaintext
+                plaintext = any('secret' in account for account in config.get('accounts', []))
+                if self.vault is not None and plaintext and not self.vault.unlocked:
+                    os.remove(temp_file)
+                    print("Vault locked - discarded a web upload holding plaintext secrets")
+                else:
+                    if self.vault is not None:
+                        self.vault.seal_accounts(config.get('accounts', []))
+                        config['vault'] = self.vault.header
+                    
+                    # Save to permanent config
+                    with open(config_file, 'w') as f:
+                        json.dump(config, f)
+                    
+                    # Delete temporary file for security
+                    os.remove(temp_file)
+                    print("Configuration updated from web interface")
                 
             except Exception as e:
                 print(f"Error processing temp config: {e}")
@@ -76,30 +149,315 @@ class TOTPAuthenticator:
         try:
             with open(config_file, 'r') as f:
                 config = json.load(f)
+            
+            # Accounts saved before ids existed get a permanent one now
+            if assign_ids(config.get('accounts', [])):
+                try:
+                    with open(config_file, 'w') as f:
+                        json.dump(config, f)
+                except OSError as e:
+                    # Read-only while USB has the drive; ids are assigned again next boot
+                    print(f"Could not store account ids: {e}")
+            
+            if config.get('settings', {}).get('profiling'):
+                self.profiler.enable()
                 
             self.accounts = []
+            self.unsealed = []
+            self.order = []
+            self.ranking = []
+            sort_keys = []
+            hotp_counters = []
             for account_data in config.get('accounts', []):
                 try:
-                    totp = TOTP(
-                        secret=account_data['secret'],
-                        name=account_data.get('name', 'Unknown'),
-                        issuer=account_data.get('issuer', ''),
-                        digits=account_data.get('digits', 6),
-                        interval=account_data.get('period', 30)
-                    )
-                    self.accounts.append({
-                        'totp': totp,
+                    account = {
+                        'totp': None,
+                        'type': account_data.get('type', 'totp'),
+                        'key': account_data['id'],
+                        'sealed': account_data.get('sealed'),
                         'name': account_data.get('name', 'Unknown'),
                         'issuer': account_data.get('issuer', ''),
+                        'digits': account_data.get('digits', 6),
+                        'period': account_data.get('period', 30),
                         'color': account_data.get('color', 0xFFFFFF)
-                    })
+                    }
+                    # Sealed secrets are decrypted lazily in refresh_codes()
+                    if account['sealed'] is None:
+                        account['totp'] = self.make_totp(account, account_data['secret'])
+                    if account['type'] == 'hotp':
+                        hotp_counters.append((account['key'], account_data.get('counter', 0),
+                                              account['name']))
+                    self.accounts.append(account)
+                    self.index_account(sort_keys, len(self.accounts) - 1)
+                    self.rank_account(len(self.accounts) - 1)
                 except Exception as e:
                     print(f"Error loading account {account_data.get('name', 'Unknown')}: {e}")
+            
+            self.build_buckets(sort_keys)
                     
         except (OSError, ValueError) as e:
             print(f"No config file found or error loading: {e}")
             # Create default config
             self.create_default_config()
+            return
+        
+        # One write reserves counters for every HOTP account before display.
+        # Kept out of the try above: a failed write is not a missing config.
+        try:
+            self.counters.register(hotp_counters)
+        except OSError as e:
+            print(f"Error reserving HOTP counters: {e}")
+    
+    def open_vault(self, config_file):
+        """Return the config's SecretVault (unlocked if possible), or None"""
+        try:
+            with open(config_file, 'r') as f:
+                header = json.load(f).get('vault')
+        except (OSError, ValueError):
+            return None
+        if header is None:
+            return None
+        
+        vault = SecretVault(header)
+        if self.passphrase:
+            try:
+                vault.unlock(self.passphrase)
+            except ValueError as e:
+                print(f"Vault: {e}")
+        return vault
+    
+    def sort_key(self, account):
+        """Lowercase issuer/name; names not starting with a letter sort first"""
+        key = f"{account['issuer']}:{account['name']}" if account['issuer'] else account['name']
+        key = key.lower()
+        return key if key[:1].isalpha() else " " + key
+    
+    def index_account(self, sort_keys, index):
+        """Insert a newly loaded account into the display order (binary search)"""
+        key = self.sort_key(self.accounts[index])
+        low, high = 0, len(sort_keys)
+        while low < high:
+            mid = (low + high) // 2
+            if sort_keys[mid] <= key:
+                low = mid + 1
+            else:
+                high = mid
+        sort_keys.insert(low, key)
+        self.order.insert(low, index)
+    
+    def build_buckets(self, sort_keys):
+        """Record where each initial letter starts; the sort keys can then be dropped"""
+        self.buckets = []
+        for position, key in enumerate(sort_keys):
+            letter = key[0].upper() if key[0].isalpha() else "#"
+            if not self.buckets or self.buckets[-1][0] != letter:
+                self.buckets.append((letter, position))
+    
+    def rank_account(self, index):
+        """Add an account to the usage ranking"""
+        self.ranking.append(index)
+        self.promote(len(self.ranking) - 1)
+    
+    def promote(self, position):
+        """Swap a ranked account up past neighbours it is now used more than"""
+        ranking = self.ranking
+        count = self.usage.count(self.accounts[ranking[position]]['key'])
+        while position > 0 and count > self.usage.count(self.accounts[ranking[position - 1]]['key']):
+            ranking[position - 1], ranking[position] = ranking[position], ranking[position - 1]
+            position -= 1
+    
+    def favourites(self):
+        """Accounts for page one: the most used, if any have been used"""
+        return [index for index in self.ranking[:self.codes_per_page]
+                if self.usage.count(self.accounts[index]['key'])]
+    
+    def record_use(self):
+        """Count a pin or jump for every account on the page"""
+        had_favourites = bool(self.favourites())
+        for index in self.page_indices():
+            self.usage.bump(self.accounts[index]['key'])
+            self.promote(self.ranking.index(index))
+        if not had_favourites and self.favourites():
+            # Page one was just added in front; stay on the same accounts
+            self.current_page += 1
+    
+    def page_offset(self):
+        """Pages in front of the alphabetical ones"""
+        return 1 if self.favourites() else 0
+    
+    def page_count(self):
+        return self.page_offset() + (len(self.order) + self.codes_per_page - 1) // self.codes_per_page
+    
+    def make_totp(self, account, secret):
+        """Build the TOTP or HOTP generator for an account"""
+        if account['type'] == 'hotp':
+            return HOTP(
+                secret=secret,
+                name=account['name'],
+                issuer=account['issuer'],
+                digits=account['digits']
+            )
+        return TOTP(
+            secret=secret,
+            name=account['name'],
+            issuer=account['issuer'],
+            digits=account['digits'],
+            interval=account['period']
+        )
+    
+    def unseal_account(self, account):
+        """Decrypt a sealed secret for the page that shows it
+        
+        The generator is built straight from the decrypted bytearray, so the
+        secret never becomes an immutable str that can't be cleared.
+        """
+        started = self.profiler.start()
+        secret = self.vault.open(account['sealed'])
+        try:
+            account['totp'] = self.make_totp(account, secret)
+        finally:
+            zero(secret)
+        self.unsealed.append(account)
+        self.profiler.record("decrypt", started)
+    
+    def release_accounts(self, page):
+        """Zero and drop decrypted generators for accounts no longer on screen"""
+        for account in self.unsealed[:]:
+            if not any(shown is account for shown in page):
+                account['totp'].wipe()
+                account['totp'] = None
+                self.unsealed.remove(account)
+    
+    def account_code(self, account, now):
+        """Current code for an account, unsealing it on first display"""
+        if account['totp'] is None:
+            if self.vault is None or not self.vault.unlocked:
+                return "LOCKED"
+            try:
+                self.unseal_account(account)
+            except ValueError as e:
+                print(f"Error unsealing {account['name']}: {e}")
+                return "ERROR"
+        if account['type'] == 'hotp':
+            if not self.counters.reserved_for(account['key']):
+                # Never show a counter a crash could hand out again
+                return "ERROR"
+            return account['totp'].at(self.counters.value(account['key']))
+        return account['totp'].at(now)
+    
+    def transient_code(self, account, now):
+        """Code for an account that may be off screen, without unsealing it for good
+        
+        A generator already built for the page is reused; otherwise a sealed
+        secret is decrypted into a temporary generator that is wiped at once.
+        """
+        if account['totp'] is not None:
+            return account['totp'].at(now)
+        if self.vault is None or not self.vault.unlocked:
+            return "LOCKED"
+        try:
+            secret = self.vault.open(account['sealed'])
+        except ValueError as e:
+            print(f"Error unsealing {account['name']}: {e}")
+            return "ERROR"
+        try:
+            otp = self.make_totp(account, secret)
+        finally:
+            zero(secret)
+        try:
+            return otp.at(now)
+        finally:
+            otp.wipe()
+    
+    def advance_hotp(self):
+        """Step the first HOTP account on the current page to its next counter"""
+        for account in self.page_accounts():
+            if account['type'] == 'hotp':
+                try:
+                    counter = self.counters.advance(account['key'])
+                    print(f"{account['name']}: counter {counter}")
+                except OSError as e:
+                    print(f"Error reserving counter for {account['name']}: {e}")
+                return True
+        return False
+    
+    def check_button(self):
+        """Short press on release, or step through letters while held"""
+        if self.button is None:
+            return
+        pressed = not self.button.value
+        now = time.monotonic()
+        if pressed and not self.button_down:
+            self.press_started = now
+            self.next_step = now + self.long_press
+            self.button_held = False
+        elif pressed and now >= self.next_step:
+            self.button_held = True
+            self.next_step = now + self.bucket_step
+            self.jump_to_next_bucket()
+        elif not pressed and self.button_down:
+            if self.button_held:
+                # The letter the hold stopped at is the one wanted
+                self.record_use()
+            elif now - self.press_started >= 0.03:  # ignore contact bounce
+                self.short_press()
+        self.button_down = pressed
+    
+    def short_press(self):
+        """Advance the page's HOTP counter, otherwise pin or unpin the page"""
+        if self.advance_hotp():
+            self.pin_page()
+            self.record_use()
+        elif self.pinned_until > time.monotonic():
+            self.pinned_until = 0
+            self.last_page_change = time.monotonic()
+        else:
+            self.pin_page()
+            self.record_use()
+        self.redraw()
+    
+    def pin_page(self):
+        """Hold the current page until pin_timeout passes"""
+        self.pinned_until = time.monotonic() + self.pin_timeout
+    
+    def jump_to_next_bucket(self):
+        """Show the page holding the next initial letter and pin it"""
+        if not self.buckets:
+            return
+        offset = self.page_offset()
+        target = self.buckets[0]
+        for bucket in self.buckets:
+            if offset + bucket[1] // self.codes_per_page > self.current_page:
+                target = bucket
+                break
+        self.current_page = offset + target[1] // self.codes_per_page
+        self.pin_page()
+        self.redraw()
+    
+    def letter_at(self, position):
+        """Initial letter of the account at a display position"""
+        letter = "#"
+        for bucket in self.buckets:
+            if bucket[1] > position:
+                break
+            letter = bucket[0]
+        return letter
+    
+    def page_letters(self):
+        """Letter range covered by the current page, such as D-G"""
+        if self.current_page < self.page_offset():
+            return "*"
+        first = (self.current_page - self.page_offset()) * self.codes_per_page
+        last = min(first + self.codes_per_page, len(self.order)) - 1
+        start, end = self.letter_at(first), self.letter_at(last)
+        return start if start == end else f"{start}-{end}"
+    
+    def expiry_text(self, account, short=False):
+        """Seconds left for TOTP codes, the counter for HOTP codes"""
+        if account['type'] == 'hotp':
+            return f"#{self.counters.value(account['key'])}"
+        remaining = 30 - self.current_time() % 30
+        return f"{remaining}s" if short else f"Expires in: {remaining}s"
     
     def create_default_config(self):
         """Create a default configuration file"""
@@ -147,9 +505,20 @@ class TOTPAuthenticator:
         )
         self.display_group.append(title_text)
         
+        # Flag codes generated from an unverified clock
+        if self.clock is not None and not self.clock.trusted():
+            clock_text = label.Label(
+                terminalio.FONT,
+                text="CLOCK?" if self.clock.state() == "unsynced" else "CLOCK!",
+                color=0xFFAA00,
+                x=120,
+                y=15
+            )
+            self.display_group.append(clock_text)
+        
         # Page indicator
-        if len(self.accounts) > self.codes_per_page:
-            total_pages = (len(self.accounts) + self.codes_per_page - 1) // self.codes_per_page
+        total_pages = self.page_count()
+        if total_pages > 1:
             page_text = label.Label(
                 terminalio.FONT,
                 text=f"{self.current_page + 1}/{total_pages}",
@@ -159,6 +528,17 @@ class TOTPAuthenticator:
             )
             self.display_group.append(page_text)
         
+        # Pinned pages show their letter instead of rotating
+        if self.pinned_until > time.monotonic():
+            pin_text = label.Label(
+                terminalio.FONT,
+                text=f"[{self.page_letters()}]",
+                color=0x00AAFF,
+                x=self.width - 76,
+                y=15
+            )
+            self.display_group.append(pin_text)
+        
         # Account display areas
         self.setup_account_display()
     
@@ -175,21 +555,44 @@ class TOTPAuthenticator:
             self.display_group.append(no_accounts_text)
             return
         
-        # Calculate accounts to show on current page
-        start_idx = self.current_page * self.codes_per_page
-        end_idx = min(start_idx + self.codes_per_page, len(self.accounts))
-        current_accounts = self.accounts[start_idx:end_idx]
+        current_accounts = self.page_accounts()
         
         # Calculate layout based on number of accounts
         num_accounts = len(current_accounts)
         if num_accounts == 1:
-            self.display_single_account(current_accounts[0], 0)
+            self.display_single_account(current_accounts[0], self.page_codes[0], 0)
         elif num_accounts == 2:
             self.display_two_accounts(current_accounts)
         else:  # 3 accounts
             self.display_three_accounts(current_accounts)
     
-    def display_single_account(self, account, y_offset=40):
+    def page_indices(self):
+        """Indices into self.accounts for the current page"""
+        offset = self.page_offset()
+        if self.current_page < offset:
+            return self.favourites()
+        start_idx = (self.current_page - offset) * self.codes_per_page
+        end_idx = min(start_idx + self.codes_per_page, len(self.order))
+        return self.order[start_idx:end_idx]
+    
+    def page_accounts(self):
+        """Return the accounts shown on the current page"""
+        return [self.accounts[index] for index in self.page_indices()]
+    
+    def refresh_codes(self):
+        """Generate codes for the accounts on the current page"""
+        now = self.current_time()
+        page = self.page_accounts()
+        self.release_accounts(page)
+        self.page_codes = [self.account_code(account, now) for account in page]
+    
+    def current_time(self):
+        """UNIX time from the synced clock when available, else the RTC"""
+        if self.clock is not None:
+            return self.clock.now()
+        return int(time.time())
+    
+    def display_single_account(self, account, code, y_offset=40):
         """Display single account with large text"""
         y_pos = y_offset + 60
         
@@ -205,7 +608,6 @@ class TOTPAuthenticator:
         self.display_group.append(name_label)
         
         # TOTP Code (large)
-        code = account['totp'].now()
         code_label = label.Label(
             terminalio.FONT,
             text=code,
@@ -216,11 +618,10 @@ class TOTPAuthenticator:
         )
         self.display_group.append(code_label)
         
-        # Time remaining
-        remaining = 30 - (int(time.time()) % 30)
+        # Time remaining, or the counter for HOTP
         time_label = label.Label(
             terminalio.FONT,
-            text=f"Expires in: {remaining}s",
+            text=self.expiry_text(account),
             color=0x888888,
             x=10,
             y=y_pos + 70
@@ -249,7 +650,7 @@ class TOTPAuthenticator:
             self.display_group.append(name_label)
             
             # TOTP Code
-            code = account['totp'].now()
+            code = self.page_codes[i]
             code_label = label.Label(
                 terminalio.FONT,
                 text=code,
@@ -259,6 +660,18 @@ class TOTPAuthenticator:
                 scale=2
             )
             self.display_group.append(code_label)
+            
+            # HOTP counter (this layout has no countdown)
+            if account['type'] == 'hotp':
+                counter_text = self.expiry_text(account, short=True)
+                counter_label = label.Label(
+                    terminalio.FONT,
+                    text=counter_text,
+                    color=0x888888,
+                    x=self.width - 7 - 6 * len(counter_text),
+                    y=y_pos + 10
+                )
+                self.display_group.append(counter_label)
     
     def display_three_accounts(self, accounts):
         """Display three accounts with compact text"""
@@ -282,7 +695,7 @@ class TOTPAuthenticator:
             self.display_group.append(name_label)
             
             # TOTP Code
-            code = account['totp'].now()
+            code = self.page_codes[i]
             code_label = label.Label(
                 terminalio.FONT,
                 text=code,
@@ -293,39 +706,70 @@ class TOTPAuthenticator:
             )
             self.display_group.append(code_label)
             
-            # Time remaining (small)
-            remaining = 30 - (int(time.time()) % 30)
+            # Time remaining (small), right-aligned
+            expiry = self.expiry_text(account, short=True)
             time_label = label.Label(
                 terminalio.FONT,
-                text=f"{remaining}s",
+                text=expiry,
                 color=0x666666,
-                x=self.width - 25,
+                x=self.width - 7 - 6 * len(expiry),
                 y=y_pos + 30
             )
             self.display_group.append(time_label)
     
     def update_display(self):
         """Update the display with current TOTP codes"""
-        current_time = time.time()
+        profiler = self.profiler
+        tick_start = profiler.start()
+        current_time = self.current_time()
+        # Intervals use the monotonic clock so an RTC correction can't stall them
+        tick = time.monotonic()
+        
+        # Page one (most used) dwells longer than the alphabetical pages
+        interval = self.page_rotation_interval
+        if self.current_page < self.page_offset():
+            interval *= self.favourite_dwell
         
         # Check if we need to rotate pages
-        if (len(self.accounts) > self.codes_per_page and 
-            current_time - self.last_page_change >= self.page_rotation_interval):
+        total_pages = self.page_count()
+        if (total_pages > 1 and 
+            tick >= self.pinned_until and
+            tick - self.last_page_change >= interval):
             
-            total_pages = (len(self.accounts) + self.codes_per_page - 1) // self.codes_per_page
             self.current_page = (self.current_page + 1) % total_pages
-            self.last_page_change = current_time
-            self.setup_display()
+            self.last_page_change = tick
+            self.redraw()
+            profiler.record_tick(tick_start, current_time)
             return
         
         # Update codes every second
-        if current_time - self.last_update >= 1:
-            self.setup_display()
-            self.last_update = current_time
+        if tick - self.last_update >= 1:
+            self.redraw()
+            self.last_update = tick
             
             # Blink when codes refresh (every 30 seconds)
-            if int(current_time) % 30 == 0:
+            if current_time % 30 == 0:
+                started = profiler.start()
                 self.blinky.blink(count=1, on_time=0.1, off_time=0.1)
+                profiler.record("blink", started)
+            
+            profiler.record_tick(tick_start, current_time)
+    
+    def redraw(self):
+        """Regenerate codes, rebuild the display group and push it to the panel"""
+        profiler = self.profiler
+        
+        started = profiler.start()
+        self.refresh_codes()
+        profiler.record("codes", started)
+        
+        started = profiler.start()
+        self.setup_display()
+        profiler.record("rebuild", started)
+        
+        started = profiler.start()
+        self.display.refresh()
+        profiler.record("refresh", started)
     
     def run(self):
         """Main application loop"""
@@ -334,7 +778,14 @@ class TOTPAuthenticator:
         
         while True:
             try:
+                self.check_button()
                 self.update_display()
+                
+                started = self.profiler.start()
+                for task in self.tasks:
+                    task.poll()
+                self.profiler.record("tasks", started)
+                
                 time.sleep(0.1)
             except KeyboardInterrupt:
                 print("Shutting down...")
@@ -0,0 +1,303 @@
+"""
+Pluggable HMAC-SHA1 backend for TOTP/HOTP codes
+Every available implementation is probed at import, checked against the
+RFC 6238 test vectors and timed; the fastest correct one generates all codes.
+Set TOTP_HMAC_BACKEND in settings.toml to force one.
+"""
+import os
+import time
+import struct
+
+BLOCK_SIZE = 64  # SHA-1 block size
+PROBE_ROUNDS = 8  # codes timed per backend at import
+BASE32_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+
+# RFC 6238 appendix B, SHA-1: the ASCII key "12345678901234567890", 8 digits, 30 s
+RFC6238_SECRET = "GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ"
+RFC6238_VECTORS = (
+    (59, "94287082"),
+    (1111111109, "07081804"),
+    (1111111111, "14050471"),
+    (1234567890, "89005924"),
+    (2000000000, "69279037"),
+    (20000000000, "65353130"),
+)
+
+
+def base32_decode(secret):
+    """Decode a base32 secret (str or bytes-like), ignoring case, spaces and padding
+
+    Returns a bytearray so the caller can zero the key once it is done with it.
+    """
+    buffer = 0
+    bits = 0
+    key = bytearray()
+    for char in secret:
+        # Work on character codes so a decrypted bytearray is never copied into a str
+        code = ord(char) if isinstance(char, str) else char
+        if code in (32, 45, 61):  # space, '-', '='
+            continue
+        if 97 <= code <= 122:
+            code -= 32  # lower case
+        if 65 <= code <= 90:
+            value = code - 65
+        elif 50 <= code <= 55:
+            value = code - 24  # '2'-'7' are 26-31
+        else:
+            raise ValueError(f"Invalid base32 character: {chr(code)}")
+        buffer = (buffer << 5) | value
+        bits += 5
+        if bits >= 8:
+            bits -= 8
+            key.append((buffer >> bits) & 0xFF)
+            buffer &= (1 << bits) - 1
+    return key
+
+
+def wipe(buffer):
+    """Overwrite key material held in a bytearray"""
+    for i in range(len(buffer)):
+        buffer[i] = 0
+
+
+def truncate(digest, digits):
+    """RFC 4226 dynamic truncation of an HMAC-SHA1 digest"""
+    offset = digest[19] & 0x0F
+    value = ((digest[offset] & 0x7F) << 24 | digest[offset + 1] << 16 |
+             digest[offset + 2] << 8 | digest[offset + 3])
+    code = str(value % 10 ** digits)
+    return "0" * (digits - len(code)) + code
+
+
+class SHA1Key:
+    """HMAC-SHA1 over a hash constructor, with the key pads computed once
+
+    The pads are bytearrays so wipe() can clear them.
+    """
+
+    def __init__(self, sha1, key):
+        if len(key) > BLOCK_SIZE:
+            key = sha1(key).digest()
+        self.sha1 = sha1
+        self.inner = bytearray(BLOCK_SIZE)
+        self.outer = bytearray(BLOCK_SIZE)
+        for i in range(BLOCK_SIZE):
+            b = key[i] if i < len(key) else 0
+            self.inner[i] = b ^ 0x36
+            self.outer[i] = b ^ 0x5C
+
+    def digest(self, message):
+        # update() rather than concatenation, so no copy of a pad is left behind
+        inner = self.sha1()
+        inner.update(self.inner)
+        inner.update(message)
+        outer = self.sha1()
+        outer.update(self.outer)
+        outer.update(inner.digest())
+        return outer.digest()
+
+
+# Each loader returns make(secret, digits) -> (code(counter), buffers), or raises
+# ImportError; buffers are the bytearrays holding key material, for wipe()
+
+def load_hmac():
+    """C hmac module (CPython)"""
+    import hmac
+    import hashlib
+
+    def make(secret, digits):
+        key = base32_decode(secret)
+        return (lambda counter: truncate(
+            hmac.new(key, struct.pack(">Q", counter), hashlib.sha1).digest(), digits)), (key,)
+    return make
+
+
+def load_sha1(module_name):
+    """HMAC built here over a module's native SHA-1"""
+    module = __import__(module_name)
+    sha1 = getattr(module, "sha1", None)
+    if sha1 is None:
+        sha1 = lambda data=b"": module.new("sha1", data)
+
+    def make(secret, digits):
+        raw = base32_decode(secret)
+        key = SHA1Key(sha1, raw)
+        wipe(raw)
+        return (lambda counter: truncate(key.digest(struct.pack(">Q", counter)), digits)), \
+            (key.inner, key.outer)
+    return make
+
+
+def load_pyotp():
+    """Pure-Python path of pyotp_circuitpython"""
+    from pyotp_circuitpython import HOTP as LibraryHOTP
+
+    def make(secret, digits):
+        # Same normalisation as base32_decode. The library keeps the secret as a
+        # str, so this backend has nothing wipe() can clear.
+        if not isinstance(secret, str):
+            secret = bytes(secret).decode()
+        secret = "".join(char for char in secret.upper() if char not in " =-")
+        return LibraryHOTP(secret, digits=digits).at, ()
+    return make
+
+
+CANDIDATES = (
+    ("hmac", load_hmac),
+    ("hashlib", lambda: load_sha1("hashlib")),
+    ("adafruit_hashlib", lambda: load_sha1("adafruit_hashlib")),
+    ("pyotp", load_pyotp),
+)
+
+
+def self_test(make):
+    """True if a backend reproduces the RFC 6238 SHA-1 vectors"""
+    code, _ = make(RFC6238_SECRET, 8)
+    for timestamp, expected in RFC6238_VECTORS:
+        if code(timestamp // 30) != expected:
+            return False
+    return True
+
+
+def time_backend(make, rounds):
+    """Nanoseconds per code"""
+    code, _ = make(RFC6238_SECRET, 6)
+    started = time.monotonic_ns()
+    for counter in range(rounds):
+        code(counter)
+    return (time.monotonic_ns() - started) // rounds
+
+
+def probe():
+    """Return {name: make} for every backend that imports and passes the self-test"""
+    available = {}
+    for name, loader in CANDIDATES:
+        try:
+            make = loader()
+        except ImportError:
+            continue
+        try:
+            passed = self_test(make)
+        except Exception as e:
+            # e.g. a hashlib build without SHA-1
+            print(f"OTP backend {name} unusable: {e}")
+            continue
+        if passed:
+            available[name] = make
+        else:
+            print(f"OTP backend {name} failed the RFC 6238 self-test")
+    return available
+
+
+def select(name=None):
+    """Use the named backend, or the fastest available one"""
+    global backend_name, make_code
+    if name is None:
+        timings = {key: time_backend(make, PROBE_ROUNDS) for key, make in AVAILABLE.items()}
+        name = min(timings, key=lambda key: timings[key])
+    elif name not in AVAILABLE:
+        raise ValueError(f"OTP backend {name} is not available ({', '.join(AVAILABLE)})")
+    backend_name = name
+    make_code = AVAILABLE[name]
+    return name
+
+
+AVAILABLE = probe()
+if not AVAILABLE:
+    raise ImportError("No working HMAC-SHA1 backend for OTP codes")
+
+backend_name = None
+make_code = None
+try:
+    select(os.getenv("TOTP_HMAC_BACKEND") or None)
+except ValueError as e:
+    print(e)
+    select()
+
+
+def quote(text):
+    """Percent-encode a URI component"""
+    return "".join(char if char.isalpha() or char.isdigit() or char in "-._~"
+                   else "".join(f"%{b:02X}" for b in char.encode("utf-8"))
+                   for char in text)
+
+
+class OTP:
+    """Code generator; a secret passed as a bytearray (decrypted from the vault)
+    is not kept, and wipe() clears the derived key"""
+
+    def __init__(self, secret, digits=6, name=None, issuer=None):
+        # Only plaintext str secrets are kept, for provisioning URIs
+        self.secret = secret if isinstance(secret, str) else None
+        self.digits = digits
+        self.name = name
+        self.issuer = issuer
+        self.code, self.buffers = make_code(secret, digits)
+
+    def wipe(self):
+        """Zero the key material; the generator can't produce codes afterwards"""
+        for buffer in self.buffers:
+            wipe(buffer)
+        self.buffers = ()
+        self.code = None
+
+    def uri(self, otp_type, name, issuer_name, params):
+        if self.secret is None:
+            raise ValueError("Secret not kept for this generator")
+        name = name or self.name or ""
+        issuer_name = issuer_name or self.issuer
+        label = f"{quote(issuer_name)}:{quote(name)}" if issuer_name else quote(name)
+        query = f"secret={self.secret}"
+        if issuer_name:
+            query += f"&issuer={quote(issuer_name)}"
+        for key, value in params:
+            query += f"&{key}={value}"
+        return f"otpauth://{otp_type}/{label}?{query}"
+
+
+class HOTP(OTP):
+    """Counter-based codes (RFC 4226)"""
+
+    def __init__(self, secret, digits=6, name=None, issuer=None, initial_count=0):
+        super().__init__(secret, digits, name, issuer)
+        self.initial_count = initial_count
+
+    def at(self, count):
+        return self.code(int(count))
+
+    def provisioning_uri(self, name=None, issuer_name=None, initial_count=None):
+        counter = self.initial_count if initial_count is None else initial_count
+        return self.uri("hotp", name, issuer_name, (("digits", self.digits), ("counter", counter)))
+
+
+class TOTP(OTP):
+    """Time-based codes (RFC 6238)"""
+
+    def __init__(self, secret, digits=6, interval=30, name=None, issuer=None):
+        super().__init__(secret, digits, name, issuer)
+        self.interval = interval
+
+    def at(self, for_time):
+        return self.code(int(for_time) // self.interval)
+
+    def now(self):
+        return self.at(time.time())
+
+    def provisioning_uri(self, name=None, issuer_name=None):
+        return self.uri("totp", name, issuer_name, (("digits", self.digits), ("period", self.interval)))
+
+
+def benchmark(rounds=200):
+    """Print self-test time and per-code cost for every available backend"""
+    print(f"{'backend':<18}{'self-test ms':>13}{'us/code':>10}")
+    for name, make in AVAILABLE.items():
+        started = time.monotonic_ns()
+        self_test(make)
+        test_ms = (time.monotonic_ns() - started) / 1e6
+        per_code = time_backend(make, rounds) / 1e3
+        marker = "  (selected)" if name == backend_name else ""
+        print(f"{name:<18}{test_ms:>13.2f}{per_code:>10.1f}{marker}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,109 @@
+"""
+Phase profiler for the TOTP display loop
+Keeps ring-buffer timings per phase using time.monotonic_ns()
+"""
+import time
+
+# Histogram bucket upper bounds in microseconds (last bucket is open-ended)
+BUCKETS_US = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+
+class PhaseProfiler:
+    def __init__(self, size=64, step=30, boundary_window=1):
+        self.enabled = False
+        self.size = size
+        self.step = step
+        self.boundary_window = boundary_window
+        self.reset()
+
+    def reset(self):
+        """Drop all recorded samples"""
+        self.rings = {}
+        self.positions = {}
+        self.counts = {}
+        self.worst = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def start(self):
+        """Return a start stamp, or 0 when profiling is off"""
+        if not self.enabled:
+            return 0
+        return time.monotonic_ns()
+
+    def record(self, phase, started):
+        """Record the time elapsed since a stamp returned by start()"""
+        if not started:
+            return
+        self.add(phase, (time.monotonic_ns() - started) // 1000)
+
+    def record_tick(self, started, now):
+        """Record a whole loop tick, tracked separately near step boundaries"""
+        if not started:
+            return
+        elapsed = (time.monotonic_ns() - started) // 1000
+        self.add("tick", elapsed)
+
+        into_step = now % self.step
+        if into_step < self.boundary_window or self.step - into_step <= self.boundary_window:
+            self.add("tick_boundary", elapsed)
+
+    def add(self, phase, elapsed_us):
+        """Store one sample (microseconds) in the phase ring buffer"""
+        ring = self.rings.get(phase)
+        if ring is None:
+            ring = [0] * self.size
+            self.rings[phase] = ring
+            self.positions[phase] = 0
+            self.counts[phase] = 0
+            self.worst[phase] = 0
+
+        pos = self.positions[phase]
+        ring[pos] = elapsed_us
+        self.positions[phase] = (pos + 1) % self.size
+        self.counts[phase] += 1
+        if elapsed_us > self.worst[phase]:
+            self.worst[phase] = elapsed_us
+
+    def phase_summary(self, phase):
+        """Statistics for the samples currently held for a phase"""
+        filled = min(self.counts[phase], self.size)
+        samples = sorted(self.rings[phase][:filled])
+
+        histogram = [0] * (len(BUCKETS_US) + 1)
+        for sample in samples:
+            bucket = 0
+            while bucket < len(BUCKETS_US) and sample > BUCKETS_US[bucket]:
+                bucket += 1
+            histogram[bucket] += 1
+
+        return {
+            'count': self.counts[phase],
+            'avg_us': sum(samples) // filled,
+            'p50_us': samples[filled // 2],
+            'p95_us': samples[min(filled - 1, (filled * 95) // 100)],
+            'max_us': samples[-1],
+            'worst_us': self.worst[phase],
+            'histogram': histogram
+        }
+
+    def summary(self):
+        """Return a dict of per-phase statistics (JSON serializable)"""
+        return {
+            'enabled': self.enabled,
+            'buckets_us': list(BUCKETS_US),
+            'phases': {phase: self.phase_summary(phase) for phase in self.rings}
+        }
+
+    def print_summary(self):
+        """Print a per-phase table over serial"""
+        print(f"Profiler {'on' if self.enabled else 'off'}, last {self.size} samples per phase (us)")
+        print(f"{'phase':<14}{'count':>7}{'avg':>8}{'p50':>8}{'p95':>8}{'max':>8}{'worst':>8}")
+        for phase in self.rings:
+            s = self.phase_summary(phase)
+            print(f"{phase:<14}{s['count']:>7}{s['avg_us']:>8}{s['p50_us']:>8}"
+                  f"{s['p95_us']:>8}{s['max_us']:>8}{s['worst_us']:>8}")
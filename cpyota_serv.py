@@ -6,17 +6,59 @@ import socket
 import json
 import os
 import gc
+import time
+import errno
 from micropython import const
+from cpyota_events import CodeBroadcaster
+from cpyota_admission import AdmissionControl
+import cpyota_otp
+from cpyota_validate import validate_accounts
+from cpyota_vault import SecretVault, VaultLocked
+from cpyota_ids import assign_ids, new_account_id
 
-# HTML content (minified version of the web interface)
-HTML_CONTENT = """<!DOCTYPE html><html><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width,initial-scale=1.0"><title>TOTP Config</title><style>*{margin:0;padding:0;box-sizing:border-box}body{font-family:Arial,sans-serif;background:#667eea;padding:20px}.container{max-width:600px;margin:0 auto;background:white;border-radius:12px;box-shadow:0 10px 30px rgba(0,0,0,0.2)}.header{background:#2c3e50;color:white;padding:20px;text-align:center}.content{padding:20px}.form-group{margin-bottom:15px}label{display:block;margin-bottom:5px;font-weight:600}input,select{width:100%;padding:10px;border:2px solid #ddd;border-radius:6px}.btn{background:#667eea;color:white;border:none;padding:12px 24px;border-radius:6px;cursor:pointer;margin:5px}.btn:hover{background:#5a67d8}.btn-danger{background:#e53e3e}.account-item{background:#f7fafc;border:1px solid #e2e8f0;border-radius:6px;padding:15px;margin:10px 0;display:flex;justify-content:space-between;align-items:center}.status{padding:10px;border-radius:6px;margin:15px 0;display:none}.status.success{background:#c6f6d5;color:#22543d}.status.error{background:#fed7d7;color:#742a2a}.hidden{display:none}</style></head><body><div class="container"><div class="header"><h1>🔐 TOTP Authenticator</h1><p>Configure your ESP32-S3</p></div><div class="content"><div id="status" class="status"></div><form id="addAccountForm"><h3>Add Account</h3><div class="form-group"><label>Name *</label><input type="text" id="accountName" required></div><div class="form-group"><label>Issuer</label><input type="text" id="issuer"></div><div class="form-group"><label>Secret *</label><input type="text" id="secret" required><button type="button" class="btn" onclick="generateSecret()">Generate</button></div><div class="form-group"><label>Digits</label><select id="digits"><option value="6">6</option><option value="8">8</option></select></div><div class="form-group"><label>Period</label><select id="period"><option value="30">30s</option><option value="60">60s</option></select></div><button type="submit" class="btn">Add Account</button></form><div><h3>Accounts</h3><div id="accountsList"></div></div><div style="text-align:center;margin-top:20px"><button class="btn" onclick="uploadConfig()">Upload to Device</button><button class="btn btn-danger" onclick="clearAll()">Clear All</button></div></div></div><script>let accounts=[];document.getElementById('addAccountForm').addEventListener('submit',function(e){e.preventDefault();addAccount()});function showStatus(msg,type='success'){const s=document.getElementById('status');s.textContent=msg;s.className=`status ${type}`;s.style.display='block';setTimeout(()=>s.style.display='none',5000)}function generateSecret(){const chars='ABCDEFGHIJKLMNOPQRSTUVWXYZ234567';let secret='';for(let i=0;i<32;i++)secret+=chars.charAt(Math.floor(Math.random()*chars.length));document.getElementById('secret').value=secret;showStatus('Secret generated!')}function addAccount(){const name=document.getElementById('accountName').value.trim();const issuer=document.getElementById('issuer').value.trim();const secret=document.getElementById('secret').value.trim().toUpperCase();const digits=parseInt(document.getElementById('digits').value);const period=parseInt(document.getElementById('period').value);if(!name||!secret){showStatus('Name and secret required!','error');return}if(!/^[A-Z2-7]+=*$/.test(secret)){showStatus('Invalid base32 secret!','error');return}accounts.push({name,issuer,secret,digits,period,color:0xFFFFFF});updateAccountsList();document.getElementById('addAccountForm').reset();showStatus('Account added!')}function updateAccountsList(){const container=document.getElementById('accountsList');if(accounts.length===0){container.innerHTML='<p>No accounts</p>';return}container.innerHTML=accounts.map((acc,i)=>`<div class="account-item"><div><div><strong>${acc.name}</strong></div>${acc.issuer?`<div><small>${acc.issuer}</small></div>`:
-''}<div><small>${acc.digits} digits, ${acc.period}s</small></div></div><button class="btn btn-danger" onclick="removeAccount(${i})">Remove</button></div>`).join('')}function removeAccount(i){if(confirm('Remove account?')){accounts.splice(i,1);updateAccountsList();showStatus('Account removed!')}}function clearAll(){if(confirm('Clear all accounts?')){accounts=[];updateAccountsList();showStatus('All cleared!')}}async function uploadConfig(){if(accounts.length===0){showStatus('No accounts to upload!','error');return}try{const response=await fetch('/upload_config',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({accounts})});if(response.ok){showStatus('Uploaded successfully!');}else{throw new Error('Upload failed')}}catch(error){showStatus('Upload error: '+error.message,'error')}}updateAccountsList();</script></body></html>"""
+CONFIG_FILE = "/totp_config.json"
+TEMP_FILE = "/totp_temp.json"
+MAX_BODY_SIZE = const(16384)
+REQUEST_DEADLINE = const(1)  # seconds a client may take to send its whole request
+SEND_TIMEOUT = const(5)  # seconds each send of the response may block
+ACCEPT_BUDGET = const(2)  # connections accepted per poll(), so the display loop keeps its share
+LISTEN_BACKLOG = const(4)
+# Account fields the page may read back or change (secrets are write-only)
+PUBLIC_FIELDS = ('id', 'name', 'issuer', 'type', 'digits', 'period', 'counter', 'color')
+EDITABLE_FIELDS = ('name', 'issuer', 'type', 'secret', 'digits', 'period', 'counter', 'color')
+
+# Built by tools/build_web_asset.py from cpyota.html and streamed from flash
+ASSET_DIR = "/www"
+CHUNK_SIZE = const(1024)
+MISSING_UI = ("<!DOCTYPE html><html><body><h1>TOTP Authenticator</h1>"
+              "<p>Web interface not installed. Build it with tools/build_web_asset.py "
+              "and copy the www directory to the device.</p></body></html>")
+
+class RequestTimeout(Exception):
+    """The client did not finish sending its request before the deadline"""
+    pass
 
 class TOTPWebServer:
-    def __init__(self, port=80):
+    def __init__(self, port=80, profiler=None, authenticator=None, passphrase=None):
         self.port = port
         self.socket = None
         self.running = False
+        # Per instance so host-side stand-ins can each use their own directory
+        self.config_file = CONFIG_FILE
+        self.temp_file = TEMP_FILE
+        self.asset_dir = ASSET_DIR
+        # Optional PhaseProfiler shared with a TOTPAuthenticator in the same process
+        self.profiler = profiler
+        # With an authenticator, live codes come from its (already unlocked) accounts
+        self.authenticator = authenticator
+        # Without an authenticator, uploads are sealed with a vault unlocked from this
+        self.passphrase = passphrase
+        self.vault = None
+        time_source = authenticator.current_time if authenticator else lambda: int(time.time())
+        self.events = CodeBroadcaster(self.event_accounts, time_source)
+        self.admission = AdmissionControl()
+        # One buffer reused for every file streamed from flash
+        self.chunk = bytearray(CHUNK_SIZE)
     
     def start(self):
         """Start the web server"""
@@ -24,7 +66,12 @@ class TOTPWebServer:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.socket.bind(('', self.port))
-            self.socket.listen(1)
+            if self.port == 0:
+                # Ephemeral port (host-side tools): report the one we got
+                self.port = self.socket.getsockname()[1]
+            self.socket.listen(LISTEN_BACKLOG)
+            # Non-blocking accept so poll() can also service event streams
+            self.socket.settimeout(0)
             self.running = True
             print(f"Web server started on port {self.port}")
             return True
@@ -35,6 +82,7 @@ class TOTPWebServer:
     def stop(self):
         """Stop the web server"""
         self.running = False
+        self.events.close()
         if self.socket:
             self.socket.close()
             self.socket = None
@@ -42,58 +90,374 @@ class TOTPWebServer:
     
     def handle_request(self, client_socket):
         """Handle incoming HTTP request"""
+        keep_open = False
         try:
             # Receive request
-            request = client_socket.recv(1024).decode('utf-8')
-            if not request:
-                return
-            
-            # Parse request line
-            lines = request.split('\n')
-            if not lines:
+            request = self.read_request(client_socket)
+            if request is None:
                 return
-            
-            request_line = lines[0].strip()
-            method, path, _ = request_line.split(' ', 2)
+            method, path, headers, body = request
+            client_socket.settimeout(SEND_TIMEOUT)
             
             print(f"Request: {method} {path}")
             
             if method == 'GET' and path == '/':
                 # Serve main page
-                self.send_response(client_socket, 200, HTML_CONTENT, 'text/html')
+                self.send_asset(client_socket, 'index.html', 'text/html', headers)
                 
             elif method == 'POST' and path == '/upload_config':
                 # Handle configuration upload
-                self.handle_config_upload(client_socket, request)
+                self.handle_config_upload(client_socket, body)
+                
+            elif method == 'GET' and path == '/config':
+                # Current accounts (without secrets) and their version
+                self.handle_config_get(client_socket, headers)
+                
+            elif method == 'POST' and path == '/sync':
+                # Apply a diff against a known version
+                self.handle_config_sync(client_socket, body)
                 
             elif method == 'GET' and path == '/status':
                 # Device status
                 self.send_json_response(client_socket, 200, {
                     'status': 'ok',
                     'free_memory': gc.mem_free(),
-                    'accounts_configured': self.count_accounts()
+                    'accounts_configured': self.count_accounts(),
+                    'connections': self.admission.stats,
+                    'event_subscribers': len(self.events.subscribers),
+                    'otp_backend': cpyota_otp.backend_name
                 })
                 
+            elif method == 'GET' and path == '/events':
+                # Live codes as Server-Sent Events; the socket stays open
+                keep_open = self.handle_events(client_socket)
+                
+            elif method == 'GET' and path == '/profile':
+                # Display loop timing summary
+                if self.profiler is None:
+                    self.send_json_response(client_socket, 404, {'error': 'Profiler not attached'})
+                else:
+                    self.send_json_response(client_socket, 200, self.profiler.summary())
+                
             else:
                 # 404 Not Found
                 self.send_response(client_socket, 404, "Not Found", 'text/plain')
                 
+        except RequestTimeout:
+            # A slow sender must not hold poll(), and with it the display loop
+            client_socket.settimeout(SEND_TIMEOUT)
+            self.send_response(client_socket, 408, "Request Timeout", 'text/plain')
+            
         except Exception as e:
             print(f"Error handling request: {e}")
             self.send_response(client_socket, 500, "Internal Server Error", 'text/plain')
         
         finally:
-            client_socket.close()
+            if not keep_open:
+                client_socket.close()
     
-    def handle_config_upload(self, client_socket, request):
-        """Handle TOTP configuration upload"""
+    def send_asset(self, client_socket, name, content_type, headers):
+        """Stream a built asset from flash, preferring the gzipped copy"""
+        candidates = [(f"{self.asset_dir}/{name}", None)]
+        if 'gzip' in headers.get('accept-encoding', ''):
+            candidates.insert(0, (f"{self.asset_dir}/{name}.gz", 'gzip'))
+        
+        for path, encoding in candidates:
+            try:
+                size = os.stat(path)[6]
+                f = open(path, 'rb')
+            except OSError:
+                continue
+            
+            with f:
+                response = f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+                if encoding:
+                    response += f"Content-Encoding: {encoding}\r\n"
+                response += f"Content-Length: {size}\r\nConnection: close\r\n\r\n"
+                self.send_all(client_socket, response.encode('utf-8'))
+                
+                view = memoryview(self.chunk)
+                while True:
+                    count = f.readinto(self.chunk)
+                    if not count:
+                        break
+                    self.send_all(client_socket, view[:count])
+            return
+        
+        self.send_response(client_socket, 200, MISSING_UI, 'text/html')
+    
+    def send_all(self, client_socket, data):
+        """Send a whole buffer; socket.send() may take only part of it"""
+        view = memoryview(data)
+        while len(view):
+            sent = client_socket.send(view)
+            if sent is None:
+                return
+            view = view[sent:]
+    
+    def handle_events(self, client_socket):
+        """Subscribe a client to live code events; returns True if it was kept"""
+        if self.events.full():
+            self.send_response(client_socket, 503, "Too many event subscribers", 'text/plain')
+            return False
+        
+        self.send_all(client_socket, b"HTTP/1.1 200 OK\r\n"
+                                     b"Content-Type: text/event-stream\r\n"
+                                     b"Cache-Control: no-cache\r\n"
+                                     b"Connection: keep-alive\r\n\r\n"
+                                     b"retry: 5000\n\n")
+        client_socket.settimeout(0)
+        self.events.subscribe(client_socket)
+        return True
+    
+    def event_accounts(self):
+        """(id, name, issuer, period, code_at) for each time-based account that can produce codes
+
+        HOTP codes only change on a button press, so they are not streamed.
+        Ids are the account ids /config reports.
+        """
+        if self.authenticator is not None:
+            # transient_code() wipes any secret it had to decrypt, so streaming
+            # doesn't leave every sealed account unsealed
+            app = self.authenticator
+            return [(account['key'], account['name'], account['issuer'], account['period'],
+                     lambda now, account=account: app.transient_code(account, int(now)))
+                    for account in app.accounts if account['type'] != 'hotp']
+        
+        # Standalone server: build generators for plaintext secrets only
+        config = self.load_current_config()
+        accounts = []
+        for account in config.get('accounts', []):
+            if 'secret' not in account or account.get('type', 'totp') == 'hotp':
+                continue
+            totp = cpyota_otp.TOTP(account['secret'], digits=account.get('digits', 6),
+                                   interval=account.get('period', 30))
+            accounts.append((account['id'], account.get('name', 'Unknown'), account.get('issuer', ''),
+                             account.get('period', 30), lambda now, totp=totp: totp.at(int(now))))
+        return accounts
+    
+    def recv_before(self, client_socket, size, deadline):
+        """recv() that raises RequestTimeout once the request deadline has passed"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise RequestTimeout()
+        client_socket.settimeout(remaining)
         try:
-            # Extract JSON data from POST request
-            if '\r\n\r\n' in request:
-                _, body = request.split('\r\n\r\n', 1)
-            else:
-                body = ""
+            return client_socket.recv(size)
+        except OSError as e:
+            if time.monotonic() >= deadline or (e.args and e.args[0] in (errno.ETIMEDOUT, errno.EAGAIN)):
+                raise RequestTimeout()
+            raise
+    
+    def read_request(self, client_socket):
+        """Read one request; returns (method, path, headers, body) or None
+        
+        The whole request must arrive within REQUEST_DEADLINE, however the
+        client paces it; raises RequestTimeout otherwise.
+        """
+        deadline = time.monotonic() + REQUEST_DEADLINE
+        data = b""
+        while b"\r\n\r\n" not in data:
+            chunk = self.recv_before(client_socket, 1024, deadline)
+            if not chunk:
+                break
+            data += chunk
+            if len(data) > MAX_BODY_SIZE:
+                raise ValueError("Request headers too large")
+        if not data:
+            return None
+        
+        head, _, body = data.partition(b"\r\n\r\n")
+        lines = head.decode('utf-8').split('\r\n')
+        method, path, _ = lines[0].strip().split(' ', 2)
+        
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+        
+        # Read the rest of the body announced by Content-Length
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY_SIZE:
+            raise ValueError("Request body too large")
+        while len(body) < length:
+            chunk = self.recv_before(client_socket, min(1024, length - len(body)), deadline)
+            if not chunk:
+                break
+            body += chunk
+        
+        return method, path, headers, body.decode('utf-8')
+    
+    def load_current_config(self):
+        """Config the device will run next: a pending upload, else the saved one
+        
+        Accounts from before ids existed get one here, written back at once so
+        the page and later requests keep seeing the same id.
+        """
+        for filename in (self.temp_file, self.config_file):
+            try:
+                with open(filename, 'r') as f:
+                    config = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if assign_ids(config.get('accounts', [])):
+                try:
+                    with open(filename, 'w') as f:
+                        json.dump(config, f)
+                except OSError as e:
+                    print(f"Could not store account ids: {e}")
+            return config
+        return {'accounts': []}
+    
+    def open_vault(self, header):
+        """Unlocked vault for a config's vault header, or None"""
+        if self.authenticator is not None:
+            vault = self.authenticator.vault
+        else:
+            if self.vault is None or self.vault.header.get('salt') != header.get('salt'):
+                self.vault = SecretVault(header)
+                if self.passphrase:
+                    try:
+                        self.vault.unlock(self.passphrase)
+                    except ValueError as e:
+                        print(f"Vault: {e}")
+            vault = self.vault
+        if vault is None or not vault.unlocked or vault.header.get('salt') != header.get('salt'):
+            return None
+        return vault
+    
+    def save_pending_config(self, config):
+        """Write a new version of the config to the temp file for the next boot
+        
+        With a vault, plaintext secrets are sealed first; raises VaultLocked
+        rather than write them to flash when the vault can't be unlocked.
+        """
+        header = config.get('vault')
+        if header is not None and any('secret' in account for account in config['accounts']):
+            vault = self.open_vault(header)
+            if vault is None:
+                raise VaultLocked("Vault is locked; new secrets can't be stored encrypted")
+            vault.seal_accounts(config['accounts'])
+        with open(self.temp_file, 'w') as f:
+            json.dump(config, f)
+    
+    def handle_config_get(self, client_socket, headers):
+        """Return the device's accounts without secrets, tagged with their version"""
+        config = self.load_current_config()
+        version = config.get('version', 0)
+        etag = f'"{version}"'
+        
+        if headers.get('if-none-match') == etag:
+            self.send_response(client_socket, 304, "", 'application/json', {'ETag': etag})
+            return
+        
+        accounts = []
+        for account in config.get('accounts', []):
+            accounts.append({key: account[key] for key in PUBLIC_FIELDS if key in account})
+        
+        self.send_json_response(client_socket, 200, {
+            'version': version,
+            'accounts': accounts
+        }, {'ETag': etag})
+    
+    def handle_config_sync(self, client_socket, body):
+        """Apply add/edit/delete operations made against a known config version"""
+        try:
+            request = json.loads(body)
+            base = request['base']
+            ops = request['ops']
+            if not isinstance(ops, list) or not all(self.valid_op(op) for op in ops):
+                raise ValueError("Malformed operation")
+        except (ValueError, KeyError, TypeError):
+            self.send_json_response(client_socket, 400, {'error': 'Invalid sync request'})
+            return
+        
+        config = self.load_current_config()
+        version = config.get('version', 0)
+        if base != version:
+            self.send_json_response(client_socket, 409, {'error': 'Stale version', 'version': version})
+            return
+        
+        accounts = config.get('accounts', [])
+        by_id = {account['id']: account for account in accounts}
+        added = []
+        touched = set()
+        
+        for op in ops:
+            kind = op.get('op')
+            if kind == 'add':
+                account = {key: op['account'][key] for key in EDITABLE_FIELDS if key in op['account']}
+                account['id'] = new_account_id(by_id)
+                accounts.append(account)
+                by_id[account['id']] = account
+                added.append(account['id'])
+                touched.add(account['id'])
             
+            elif kind in ('edit', 'delete'):
+                account = by_id.get(op.get('id'))
+                if account is None:
+                    # The page's view is out of date; make it rebase
+                    self.send_json_response(client_socket, 409, {'error': f"Unknown account {op.get('id')}", 'version': version})
+                    return
+                if kind == 'delete':
+                    accounts.remove(account)
+                    del by_id[account['id']]
+                else:
+                    for key, value in op.get('changes', {}).items():
+                        if key in EDITABLE_FIELDS:
+                            account[key] = value
+                    # A new secret replaces any sealed one when the device loads it
+                    if 'secret' in op.get('changes', {}):
+                        account.pop('sealed', None)
+                    touched.add(account['id'])
+            else:
+                self.send_json_response(client_socket, 400, {'error': f'Unknown operation {kind}'})
+                return
+        
+        # Only records the ops changed need checking; the rest were checked on the way in
+        problems = validate_accounts(accounts, [index for index, account in enumerate(accounts)
+                                                if account['id'] in touched])
+        if problems:
+            self.send_json_response(client_socket, 400, {'error': 'Invalid accounts', 'records': problems})
+            return
+        
+        config['accounts'] = accounts
+        config['version'] = version + 1
+        try:
+            self.save_pending_config(config)
+        except VaultLocked as e:
+            self.send_json_response(client_socket, 423, {'error': str(e)})
+            return
+        except OSError as e:
+            self.send_json_response(client_socket, 500, {'error': f'Failed to save configuration: {e}'})
+            return
+        
+        self.send_json_response(client_socket, 200, {
+            'status': 'success',
+            'version': config['version'],
+            'added': added,
+            'accounts_count': len(accounts)
+        }, {'ETag': f'"{config["version"]}"'})
+        print(f"Configuration synced: {len(ops)} changes, version {config['version']}")
+    
+    def valid_op(self, op):
+        """True if a sync operation has the fields its kind needs"""
+        if not isinstance(op, dict):
+            return False
+        kind = op.get('op')
+        if kind == 'add':
+            return isinstance(op.get('account'), dict)
+        if kind == 'edit':
+            return isinstance(op.get('id'), str) and isinstance(op.get('changes', {}), dict)
+        if kind == 'delete':
+            return isinstance(op.get('id'), str)
+        # Unknown kinds are reported by name in handle_config_sync
+        return True
+    
+    def handle_config_upload(self, client_socket, body):
+        """Handle TOTP configuration upload"""
+        try:
             if not body:
                 self.send_json_response(client_socket, 400, {'error': 'No data received'})
                 return
@@ -110,20 +474,37 @@ class TOTPWebServer:
                 self.send_json_response(client_socket, 400, {'error': 'Invalid configuration format'})
                 return
             
+            # Reject the whole upload, listing every bad record, before touching flash
+            problems = validate_accounts(config_data['accounts'])
+            if problems:
+                self.send_json_response(client_socket, 400, {'error': 'Invalid accounts', 'records': problems})
+                return
+            
+            # A full upload replaces everything and starts a new version
+            current = self.load_current_config()
+            config_data['version'] = current.get('version', 0) + 1
+            assign_ids(config_data['accounts'])
+            # Secrets stay under the device's vault, whatever the upload claims
+            config_data.pop('vault', None)
+            if 'vault' in current:
+                config_data['vault'] = current['vault']
+            
             # Save configuration to temporary file
-            temp_file = "/totp_temp.json"
             try:
-                with open(temp_file, 'w') as f:
-                    json.dump(config_data, f)
+                self.save_pending_config(config_data)
                 
                 self.send_json_response(client_socket, 200, {
                     'status': 'success',
                     'message': 'Configuration uploaded successfully',
-                    'accounts_count': len(config_data['accounts'])
+                    'accounts_count': len(config_data['accounts']),
+                    'version': config_data['version']
                 })
                 
                 print(f"Configuration uploaded: {len(config_data['accounts'])} accounts")
                 
+            except VaultLocked as e:
+                self.send_json_response(client_socket, 423, {'error': str(e)})
+                
             except Exception as e:
                 self.send_json_response(client_socket, 500, {'error': f'Failed to save configuration: {e}'})
                 
@@ -131,37 +512,67 @@ class TOTPWebServer:
             print(f"Error in config upload: {e}")
             self.send_json_response(client_socket, 500, {'error': 'Internal server error'})
     
-    def send_response(self, client_socket, status_code, content, content_type):
+    def send_response(self, client_socket, status_code, content, content_type, headers=None):
         """Send HTTP response"""
         status_text = {
             200: 'OK',
+            304: 'Not Modified',
             400: 'Bad Request',
             404: 'Not Found',
-            500: 'Internal Server Error'
+            408: 'Request Timeout',
+            409: 'Conflict',
+            423: 'Locked',
+            500: 'Internal Server Error',
+            503: 'Service Unavailable'
         }.get(status_code, 'Unknown')
         
+        body = content.encode('utf-8')
         response = f"HTTP/1.1 {status_code} {status_text}\r\n"
         response += f"Content-Type: {content_type}\r\n"
-        response += f"Content-Length: {len(content)}\r\n"
+        response += f"Content-Length: {len(body)}\r\n"
+        if headers:
+            for key, value in headers.items():
+                response += f"{key}: {value}\r\n"
         response += "Connection: close\r\n"
         response += "\r\n"
-        response += content
         
-        client_socket.send(response.encode('utf-8'))
+        self.send_all(client_socket, response.encode('utf-8') + body)
     
-    def send_json_response(self, client_socket, status_code, data):
+    def send_json_response(self, client_socket, status_code, data, headers=None):
         """Send JSON response"""
         json_content = json.dumps(data)
-        self.send_response(client_socket, status_code, json_content, 'application/json')
+        self.send_response(client_socket, status_code, json_content, 'application/json', headers)
     
     def count_accounts(self):
-        """Count configured accounts"""
-        try:
-            with open("/totp_config.json", 'r') as f:
-                config = json.load(f)
-            return len(config.get('accounts', []))
-        except:
-            return 0
+        """Count configured accounts, including an upload pending the next boot"""
+        return len(self.load_current_config().get('accounts', []))
+    
+    def poll(self):
+        """Admit up to ACCEPT_BUDGET waiting connections and push live code events
+        
+        Never blocks waiting for a client, so it can also be polled as a task
+        from the display loop. Returns the number of connections accepted.
+        """
+        accepted = 0
+        while accepted < ACCEPT_BUDGET:
+            try:
+                client_socket, addr = self.socket.accept()
+            except OSError:
+                break  # nothing waiting
+            accepted += 1
+            
+            # Refuse before reading anything from clients over their budget
+            refusal = self.admission.admit(addr[0])
+            if refusal is not None:
+                self.admission.reject(client_socket, refusal)
+                continue
+            
+            print(f"Connection from {addr}")
+            self.handle_request(client_socket)
+            gc.collect()  # Clean up memory
+        
+        self.events.poll()
+        return accepted
     
     def run(self):
         """Main server loop"""
@@ -172,16 +583,9 @@ class TOTPWebServer:
         
         try:
             while self.running:
-                try:
-                    client_socket, addr = self.socket.accept()
-                    print(f"Connection from {addr}")
-                    self.handle_request(client_socket)
-                    gc.collect()  # Clean up memory
-                    
-                except OSError as e:
-                    if self.running:  # Only print error if we're supposed to be running
-                        print(f"Socket error: {e}")
-                        break
+                # Only idle when there was nothing to accept
+                if not self.poll():
+                    time.sleep(0.01)
                         
         except KeyboardInterrupt:
             print("Server interrupted")
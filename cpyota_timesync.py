@@ -0,0 +1,257 @@
+"""
+Background WiFi connection and SNTP time sync for the TOTP Authenticator
+Everything here is stepped from the display loop via poll(), so codes are
+shown immediately at boot and the clock is corrected once the network is up
+"""
+import os
+import time
+import struct
+
+NTP_PORT = 123
+NTP_EPOCH_OFFSET = 2208988800  # seconds from 1900-01-01 to 1970-01-01
+NTP_PACKET_SIZE = 48
+NTP_MODE_SERVER = 4
+NTP_LI_UNSYNCHRONIZED = 3
+NS_PER_SECOND = 1000000000
+MAX_DRIFT_PPB = 500000  # far beyond any crystal; larger estimates come from a bad sample
+
+
+class TimeSync:
+    """Clock model anchored to the last SNTP response
+
+    Between syncs the time is extrapolated from time.monotonic_ns() and
+    corrected by the drift measured between consecutive syncs. Times are
+    integer nanoseconds: a float can't resolve seconds at current epoch
+    values on CircuitPython, so codes would be silently wrong.
+    """
+
+    def __init__(self, max_error=2.0, resync_interval=3600):
+        self.max_error = max_error  # seconds of estimated error before codes are flagged
+        self.resync_interval = resync_interval
+        self.synced = False
+        self.base_time_ns = 0  # server UNIX time in ns at the last sync
+        self.base_ns = 0  # monotonic_ns at the last sync
+        self.drift_ppb = 0  # clock correction in parts per billion
+        self.uncertainty = 0.0  # half the round trip of the last sync
+        self.sync_count = 0
+        self.last_offset = 0.0
+
+    def now(self):
+        """Best estimate of the current UNIX time in whole seconds"""
+        if not self.synced:
+            return int(time.time())
+        return self.predict_ns(time.monotonic_ns()) // NS_PER_SECOND
+
+    def predict_ns(self, monotonic_ns):
+        """UNIX time in ns at a monotonic_ns reading, extrapolated from the last sync"""
+        elapsed = monotonic_ns - self.base_ns
+        return self.base_time_ns + elapsed + elapsed * self.drift_ppb // NS_PER_SECOND
+
+    def since_sync(self):
+        """Seconds elapsed since the last successful sync"""
+        return (time.monotonic_ns() - self.base_ns) / NS_PER_SECOND
+
+    def estimated_error(self):
+        """Upper estimate of the clock error in seconds"""
+        if not self.synced:
+            return None
+        # Assume the drift estimate is off by up to 50 ppm, plus the sync uncertainty
+        return self.uncertainty + self.since_sync() * (abs(self.drift_ppb) + 50000) / NS_PER_SECOND
+
+    def state(self):
+        """'synced', 'stale' (error may exceed max_error) or 'unsynced'"""
+        if not self.synced:
+            return "unsynced"
+        if self.estimated_error() > self.max_error:
+            return "stale"
+        return "synced"
+
+    def trusted(self):
+        """True when codes generated from now() can be relied on"""
+        return self.state() == "synced"
+
+    def needs_sync(self):
+        return not self.synced or self.since_sync() >= self.resync_interval
+
+    def apply(self, server_time_ns, round_trip_ns):
+        """Anchor the clock to a server timestamp (UNIX ns) taken at receipt"""
+        received_ns = time.monotonic_ns()
+
+        if self.synced:
+            # Compare our extrapolation with the server to measure drift
+            elapsed = received_ns - self.base_ns
+            offset_ns = server_time_ns - self.predict_ns(received_ns)
+            if elapsed > 60 * NS_PER_SECOND:
+                drift = self.drift_ppb + offset_ns * NS_PER_SECOND // elapsed
+                self.drift_ppb = max(-MAX_DRIFT_PPB, min(MAX_DRIFT_PPB, drift))
+        else:
+            offset_ns = server_time_ns - int(time.time()) * NS_PER_SECOND
+        # Offsets are small, so seconds as a float are exact enough for reporting
+        self.last_offset = offset_ns / NS_PER_SECOND
+
+        self.base_time_ns = server_time_ns
+        self.base_ns = received_ns
+        self.uncertainty = round_trip_ns / 2 / NS_PER_SECOND
+        self.synced = True
+        self.sync_count += 1
+        set_rtc(server_time_ns // NS_PER_SECOND)
+
+
+def set_rtc(unix_time):
+    """Set the board RTC so time.time() agrees with the synced clock"""
+    try:
+        import rtc
+        rtc.RTC().datetime = time.localtime(unix_time)
+    except (ImportError, OSError, ValueError):
+        pass
+
+
+class SNTPClient:
+    """Non-blocking SNTP query over a socketpool-compatible pool"""
+
+    def __init__(self, pool, server="pool.ntp.org", port=NTP_PORT, timeout=3):
+        self.pool = pool
+        self.server = server
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.sent_ns = 0
+        self.sent_stamp = b""  # our transmit field, which the reply must echo
+        self.buffer = bytearray(NTP_PACKET_SIZE)
+
+    @property
+    def pending(self):
+        return self.sock is not None
+
+    def request(self):
+        """Send a request; the answer is collected by later poll() calls"""
+        self.close()
+        addr = self.pool.getaddrinfo(self.server, self.port)[0][-1]
+        sock = self.pool.socket(self.pool.AF_INET, self.pool.SOCK_DGRAM)
+        sock.settimeout(0)
+
+        packet = bytearray(NTP_PACKET_SIZE)
+        packet[0] = 0x1B  # LI = 0, VN = 3, Mode = 3 (client)
+        # Random transmit field; only a reply to this request echoes it
+        self.sent_stamp = os.urandom(8)
+        packet[40:48] = self.sent_stamp
+        self.sent_ns = time.monotonic_ns()
+        sock.sendto(packet, addr)
+        self.sock = sock
+
+    def poll(self):
+        """Return (server_time_ns, round_trip_ns) once answered, else None
+
+        Raises OSError when the request timed out or the reply can't be trusted.
+        """
+        if self.sock is None:
+            return None
+        try:
+            size, _ = self.sock.recvfrom_into(self.buffer)
+        except OSError:
+            if time.monotonic_ns() - self.sent_ns > self.timeout * NS_PER_SECOND:
+                self.close()
+                raise OSError("SNTP request timed out")
+            return None
+
+        round_trip_ns = time.monotonic_ns() - self.sent_ns
+        self.close()
+        if size < NTP_PACKET_SIZE:
+            raise OSError("Short SNTP response")
+        check_response(self.buffer, self.sent_stamp)
+
+        receive = unpack_timestamp(self.buffer, 32)
+        transmit = unpack_timestamp(self.buffer, 40)
+        if transmit == 0:
+            raise OSError("SNTP response without transmit time")
+
+        # Round trip minus the time the server held the packet
+        round_trip_ns = max(0, round_trip_ns - (transmit - receive))
+        return transmit + round_trip_ns // 2, round_trip_ns
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def check_response(buffer, sent_stamp):
+    """Raise OSError unless a reply is from a synchronized server and answers our request"""
+    if buffer[0] & 0x07 != NTP_MODE_SERVER:
+        raise OSError("SNTP reply is not from a server")
+    if buffer[0] >> 6 == NTP_LI_UNSYNCHRONIZED:
+        raise OSError("SNTP server clock is unsynchronized")
+    if buffer[1] == 0:
+        # Kiss-o'-death: the reference id holds the reason, such as RATE
+        code = bytes(buffer[12:16]).decode("ascii", "replace")
+        raise OSError(f"SNTP kiss-o'-death {code}")
+    if bytes(buffer[24:32]) != sent_stamp:
+        raise OSError("SNTP reply does not match the request")
+
+
+def unpack_timestamp(buffer, offset):
+    """Convert a 64-bit NTP timestamp to integer UNIX nanoseconds"""
+    seconds, fraction = struct.unpack_from("!II", buffer, offset)
+    if seconds == 0:
+        return 0
+    return (seconds - NTP_EPOCH_OFFSET) * NS_PER_SECOND + (fraction * NS_PER_SECOND >> 32)
+
+
+class BackgroundNetwork:
+    """WiFi connect and SNTP sync, advanced one step per poll()"""
+
+    def __init__(self, ssid, password, clock, server="pool.ntp.org",
+                 connect_timeout=3, retry_interval=30, max_retry_interval=600):
+        self.ssid = ssid
+        self.password = password
+        self.clock = clock
+        self.server = server
+        self.connect_timeout = connect_timeout
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        # Doubles after each failed WiFi join, since every attempt stalls the display
+        self.connect_backoff = retry_interval
+        self.pool = None
+        self.client = None
+        self.next_attempt = 0
+
+    def poll(self):
+        """Advance the connection or sync by one short step"""
+        now = time.monotonic()
+        if now < self.next_attempt:
+            return
+
+        if self.pool is None:
+            try:
+                self.connect()
+                self.connect_backoff = self.retry_interval
+            except Exception as e:
+                print(f"WiFi connect failed: {e} (retry in {self.connect_backoff}s)")
+                self.next_attempt = now + self.connect_backoff
+                self.connect_backoff = min(self.connect_backoff * 2, self.max_retry_interval)
+            return
+
+        try:
+            if self.client.pending:
+                result = self.client.poll()
+                if result is not None:
+                    self.clock.apply(*result)
+                    print(f"Time synced via SNTP (offset {self.clock.last_offset:.3f}s, "
+                          f"drift {self.clock.drift_ppb / 1000:.1f} ppm)")
+            elif self.clock.needs_sync():
+                self.client.request()
+        except Exception as e:
+            print(f"Time sync error: {e}")
+            self.next_attempt = now + self.retry_interval
+
+    def connect(self):
+        """Connect to WiFi; the only step that may block (up to connect_timeout)"""
+        import wifi
+        import socketpool
+
+        if not wifi.radio.connected:
+            print("Connecting to WiFi...")
+            wifi.radio.connect(self.ssid, self.password, timeout=self.connect_timeout)
+            print(f"Connected to WiFi: {wifi.radio.ipv4_address}")
+        self.pool = socketpool.SocketPool(wifi.radio)
+        self.client = SNTPClient(self.pool, self.server)
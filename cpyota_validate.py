@@ -0,0 +1,116 @@
+"""
+Account record validation for configuration uploads
+Every record is checked in one pass before anything is written, so a bad
+secret or field is rejected with the upload instead of being skipped at boot
+"""
+
+BASE32_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+MIN_SECRET_LENGTH = 16  # base32 characters (80 bits)
+MAX_SECRET_LENGTH = 128
+MAX_NAME_LENGTH = 64
+VALID_DIGITS = (6, 7, 8)
+MIN_PERIOD = 10  # seconds
+MAX_PERIOD = 300
+MAX_REPORTED = 20  # records with errors listed in one response
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def is_hex(value):
+    if not isinstance(value, str) or not value or len(value) % 2:
+        return False
+    for char in value:
+        if char not in "0123456789abcdefABCDEF":
+            return False
+    return True
+
+
+def secret_errors(secret):
+    if not isinstance(secret, str):
+        return ["secret must be a string"]
+    # Same normalisation as cpyota_otp.base32_decode: case, spaces, '-' and '='
+    secret = "".join(char for char in secret.upper() if char not in " -=")
+    for char in secret:
+        if char not in BASE32_ALPHABET:
+            return [f"secret has invalid base32 character {char!r}"]
+    if len(secret) < MIN_SECRET_LENGTH:
+        return [f"secret must be at least {MIN_SECRET_LENGTH} base32 characters"]
+    if len(secret) > MAX_SECRET_LENGTH:
+        return [f"secret must be at most {MAX_SECRET_LENGTH} base32 characters"]
+    if len(secret) % 8 in (1, 3, 6):
+        # These lengths leave a partial byte
+        return ["secret has an invalid base32 length"]
+    return []
+
+
+def validate_account(account):
+    """Return a list of problems with one account record (empty when valid)"""
+    if not isinstance(account, dict):
+        return ["account must be an object"]
+    errors = []
+
+    name = account.get('name')
+    if not isinstance(name, str) or not name.strip():
+        errors.append("name is required")
+    elif len(name) > MAX_NAME_LENGTH:
+        errors.append(f"name must be at most {MAX_NAME_LENGTH} characters")
+
+    issuer = account.get('issuer', '')
+    if not isinstance(issuer, str):
+        errors.append("issuer must be a string")
+    elif len(issuer) > MAX_NAME_LENGTH:
+        errors.append(f"issuer must be at most {MAX_NAME_LENGTH} characters")
+
+    if 'secret' in account:
+        errors.extend(secret_errors(account['secret']))
+    elif 'sealed' in account:
+        sealed = account['sealed']
+        if not isinstance(sealed, dict) or not all(is_hex(sealed.get(key)) for key in ('n', 'c', 't')):
+            errors.append("sealed must hold hex fields n, c and t")
+    else:
+        errors.append("secret is required")
+
+    otp_type = account.get('type', 'totp')
+    if otp_type not in ('totp', 'hotp'):
+        errors.append("type must be totp or hotp")
+
+    if account.get('digits', 6) not in VALID_DIGITS or not is_int(account.get('digits', 6)):
+        errors.append("digits must be 6, 7 or 8")
+
+    period = account.get('period', 30)
+    if not is_int(period) or not MIN_PERIOD <= period <= MAX_PERIOD:
+        errors.append(f"period must be {MIN_PERIOD} to {MAX_PERIOD} seconds")
+
+    if otp_type == 'hotp':
+        counter = account.get('counter', 0)
+        if not is_int(counter) or counter < 0:
+            errors.append("counter must be a non-negative integer")
+
+    color = account.get('color', 0xFFFFFF)
+    if not is_int(color) or not 0 <= color <= 0xFFFFFF:
+        errors.append("color must be an RGB integer")
+
+    return errors
+
+
+def validate_accounts(accounts, indices=None):
+    """Check every record; returns [{'index', 'name', 'id', 'errors'}] for the bad ones
+
+    `indices` limits the check to those positions (records a sync touched).
+    """
+    problems = []
+    for index in range(len(accounts)) if indices is None else indices:
+        account = accounts[index]
+        errors = validate_account(account)
+        if errors:
+            problem = {'index': index, 'errors': errors}
+            if isinstance(account, dict):
+                problem['name'] = account.get('name')
+                if 'id' in account:
+                    problem['id'] = account['id']
+            problems.append(problem)
+            if len(problems) >= MAX_REPORTED:
+                break
+    return problems
@@ -0,0 +1,217 @@
+"""
+Encrypted at-rest storage for TOTP secrets
+The passphrase is stretched with PBKDF2-HMAC-SHA256 once per unlock; each
+account secret is then sealed on its own (HMAC-SHA256 keystream + tag), so
+records can be decrypted lazily and cheaply when their page is shown
+"""
+import os
+import time
+import json
+import struct
+import binascii
+
+try:
+    import hashlib
+except ImportError:
+    import adafruit_hashlib as hashlib
+
+VAULT_VERSION = 1
+DEFAULT_ITERATIONS = 5000
+SALT_SIZE = 16
+NONCE_SIZE = 8
+TAG_SIZE = 16
+BLOCK_SIZE = 64  # SHA-256 block size
+
+
+class VaultLocked(Exception):
+    pass
+
+
+def sha256(data=b""):
+    """SHA-256 object; CircuitPython's hashlib only provides new(name, data)"""
+    constructor = getattr(hashlib, "sha256", None)
+    if constructor is None:
+        return hashlib.new("sha256", data)
+    return constructor(data)
+
+
+class HMACKey:
+    """HMAC-SHA256 with the key pads computed once, kept in bytearrays for wipe()"""
+
+    def __init__(self, key):
+        if len(key) > BLOCK_SIZE:
+            key = sha256(key).digest()
+        self.inner = bytearray(BLOCK_SIZE)
+        self.outer = bytearray(BLOCK_SIZE)
+        for i in range(BLOCK_SIZE):
+            b = key[i] if i < len(key) else 0
+            self.inner[i] = b ^ 0x36
+            self.outer[i] = b ^ 0x5C
+
+    def digest(self, message):
+        inner = sha256()
+        inner.update(self.inner)
+        inner.update(message)
+        outer = sha256()
+        outer.update(self.outer)
+        outer.update(inner.digest())
+        return outer.digest()
+
+    def wipe(self):
+        zero(self.inner)
+        zero(self.outer)
+
+
+def pbkdf2_sha256(password, salt, iterations):
+    """Derive a 32-byte key; uses the C implementation when the port has one"""
+    if hasattr(hashlib, "pbkdf2_hmac"):
+        return hashlib.pbkdf2_hmac("sha256", password, salt, iterations)
+
+    prf = HMACKey(password)
+    block = prf.digest(salt + b"\x00\x00\x00\x01")
+    result = bytearray(block)
+    for _ in range(iterations - 1):
+        block = prf.digest(block)
+        for i in range(len(result)):
+            result[i] ^= block[i]
+    return bytes(result)
+
+
+def compare_digest(a, b):
+    """Constant-time comparison of two byte strings"""
+    if len(a) != len(b):
+        return False
+    diff = 0
+    for x, y in zip(a, b):
+        diff |= x ^ y
+    return diff == 0
+
+
+class SecretVault:
+    """Holds the vault header and, once unlocked, the derived keys"""
+
+    def __init__(self, header):
+        if header.get('version') != VAULT_VERSION:
+            raise ValueError(f"Unsupported vault version: {header.get('version')}")
+        self.header = header
+        self.enc_key = None
+        self.mac_key = None
+
+    @classmethod
+    def create(cls, passphrase, iterations=DEFAULT_ITERATIONS):
+        """Create a new vault header and return it unlocked"""
+        salt = os.urandom(SALT_SIZE)
+        vault = cls({
+            'version': VAULT_VERSION,
+            'kdf': 'pbkdf2-sha256',
+            'iterations': iterations,
+            'salt': binascii.hexlify(salt).decode(),
+            'check': ''
+        })
+        vault.derive(passphrase)
+        vault.header['check'] = binascii.hexlify(vault.check_value()).decode()
+        return vault
+
+    @property
+    def unlocked(self):
+        return self.enc_key is not None
+
+    def derive(self, passphrase):
+        """Run the KDF once and keep the resulting keys"""
+        salt = binascii.unhexlify(self.header['salt'])
+        master = pbkdf2_sha256(passphrase.encode('utf-8'), salt, self.header['iterations'])
+        master_key = HMACKey(master)
+        self.enc_key = HMACKey(master_key.digest(b"enc"))
+        self.mac_key = HMACKey(master_key.digest(b"mac"))
+        master_key.wipe()
+
+    def check_value(self):
+        return self.mac_key.digest(b"check")[:TAG_SIZE]
+
+    def unlock(self, passphrase):
+        """Derive keys from the passphrase; raises ValueError if it is wrong"""
+        self.derive(passphrase)
+        expected = binascii.unhexlify(self.header['check'])
+        if not compare_digest(self.check_value(), expected):
+            self.lock()
+            raise ValueError("Wrong passphrase")
+
+    def lock(self):
+        """Zero and forget the derived keys"""
+        for key in (self.enc_key, self.mac_key):
+            if key is not None:
+                key.wipe()
+        self.enc_key = None
+        self.mac_key = None
+
+    def keystream_xor(self, nonce, data):
+        """XOR data in place with the HMAC-SHA256 counter keystream"""
+        for block_index in range(0, len(data), 32):
+            block = self.enc_key.digest(nonce + struct.pack(">I", block_index // 32))
+            for i in range(min(32, len(data) - block_index)):
+                data[block_index + i] ^= block[i]
+
+    def seal(self, secret):
+        """Encrypt a secret string into a JSON-friendly record"""
+        if not self.unlocked:
+            raise VaultLocked("Vault is locked")
+        nonce = os.urandom(NONCE_SIZE)
+        data = bytearray(secret.encode('utf-8'))
+        self.keystream_xor(nonce, data)
+        tag = self.mac_key.digest(nonce + data)[:TAG_SIZE]
+        return {
+            'n': binascii.hexlify(nonce).decode(),
+            'c': binascii.hexlify(data).decode(),
+            't': binascii.hexlify(tag).decode()
+        }
+
+    def open(self, sealed):
+        """Decrypt a sealed record into a bytearray the caller should zero()"""
+        if not self.unlocked:
+            raise VaultLocked("Vault is locked")
+        nonce = binascii.unhexlify(sealed['n'])
+        data = bytearray(binascii.unhexlify(sealed['c']))
+        tag = self.mac_key.digest(nonce + data)[:TAG_SIZE]
+        if not compare_digest(tag, binascii.unhexlify(sealed['t'])):
+            raise ValueError("Sealed secret failed authentication")
+        self.keystream_xor(nonce, data)
+        return data
+
+    def seal_accounts(self, accounts):
+        """Replace plaintext 'secret' fields with 'sealed' records in place"""
+        for account in accounts:
+            if 'secret' in account:
+                account['sealed'] = self.seal(account.pop('secret'))
+        return accounts
+
+
+def zero(buffer):
+    """Overwrite a decrypted secret buffer"""
+    for i in range(len(buffer)):
+        buffer[i] = 0
+
+
+def benchmark(passphrase="benchmark", iterations=DEFAULT_ITERATIONS, accounts=3, rounds=10):
+    """Print unlock time and the cost of decrypting one page of accounts"""
+    vault = SecretVault.create(passphrase, iterations)
+    header = json.loads(json.dumps(vault.header))
+    records = [vault.seal("JBSWY3DPEHPK3PXPJBSWY3DPEHPK3PXP") for _ in range(accounts)]
+
+    vault = SecretVault(header)
+    started = time.monotonic_ns()
+    vault.unlock(passphrase)
+    unlock_ms = (time.monotonic_ns() - started) / 1e6
+
+    started = time.monotonic_ns()
+    for _ in range(rounds):
+        for record in records:
+            zero(vault.open(record))
+    page_ms = (time.monotonic_ns() - started) / 1e6 / rounds
+
+    print(f"Vault unlock ({iterations} PBKDF2 iterations): {unlock_ms:.1f} ms")
+    print(f"Page decrypt ({accounts} accounts): {page_ms:.3f} ms")
+    return unlock_ms, page_ms
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,15 +1,23 @@
  
- """
+"""
 Console interface for TOTP Authenticator configuration
 """
 import json
 import os
-from pyotp_circuitpython import TOTP, random_base32, base32_encode
+from pyotp_circuitpython import random_base32, base32_encode
+from cpyota_otp import TOTP, HOTP
+from cpyota_vault import SecretVault, DEFAULT_ITERATIONS, zero
+from cpyota_counters import CounterStore
+from cpyota_ids import assign_ids, new_account_id
+import cpyota_backup
 
 class TOTPConsole:
     def __init__(self):
         self.config_file = "/totp_config.json"
         self.accounts = []
+        self.vault = None
+        self.version = 0
+        self.counters = CounterStore()
         self.load_config()
     
     def load_config(self):
@@ -18,15 +26,82 @@ class TOTPConsole:
             with open(self.config_file, 'r') as f:
                 config = json.load(f)
             self.accounts = config.get('accounts', [])
+            self.version = config.get('version', 0)
+            if 'vault' in config:
+                self.vault = SecretVault(config['vault'])
         except:
             self.accounts = []
+            return
+        # Store ids for accounts saved before ids existed, without a new version
+        if assign_ids(self.accounts):
+            self.write_config()
     
     def save_config(self):
         """Save configuration to file"""
-        config = {"accounts": self.accounts}
+        # Bump the version so web pages synced against the old one rebase
+        self.version += 1
+        self.write_config()
+        print("Configuration saved!")
+    
+    def write_config(self):
+        """Write accounts, version and vault header; every account keeps its id"""
+        assign_ids(self.accounts)
+        config = {"accounts": self.accounts, "version": self.version}
+        if self.vault is not None:
+            config['vault'] = self.vault.header
         with open(self.config_file, 'w') as f:
             json.dump(config, f)
-        print("Configuration saved!")
+    
+    def unlock(self):
+        """Unlock the vault once per session; the derived key is kept"""
+        if self.vault is None or self.vault.unlocked:
+            return True
+        passphrase = input("Vault passphrase: ")
+        try:
+            self.vault.unlock(passphrase)
+            return True
+        except ValueError as e:
+            print(f"Error: {e}")
+            return False
+    
+    def seal(self, account):
+        """Encrypt a new account's secret when a vault is in use"""
+        if self.vault is None:
+            return True
+        if not self.unlock():
+            return False
+        self.vault.seal_accounts([account])
+        return True
+    
+    def make_otp(self, account, secret):
+        """Build the TOTP or HOTP generator matching the account type"""
+        if account.get('type', 'totp') == 'hotp':
+            return HOTP(secret, digits=account['digits'])
+        return TOTP(secret, digits=account['digits'], interval=account['period'])
+    
+    def account_otp(self, account):
+        """Build the generator for a stored account, decrypting its secret if sealed"""
+        if 'sealed' not in account:
+            return self.make_otp(account, account['secret'])
+        if not self.unlock():
+            raise ValueError("Vault is locked")
+        secret = self.vault.open(account['sealed'])
+        try:
+            return self.make_otp(account, secret)
+        finally:
+            zero(secret)
+    
+    def current_code(self, account):
+        """Code the device shows now; HOTP uses the persisted counter"""
+        otp = self.account_otp(account)
+        try:
+            if account.get('type', 'totp') == 'hotp':
+                # Counters the display hasn't moved to the id yet are under the name
+                initial = self.counters.value(account['name'], account.get('counter', 0))
+                return otp.at(self.counters.value(account['id'], initial))
+            return otp.now()
+        finally:
+            otp.wipe()
     
     def add_account(self):
         """Add a new TOTP account"""
@@ -39,6 +114,10 @@ class TOTPConsole:
         
         issuer = input("Issuer (optional): ").strip()
         
+        otp_type = input("Type - totp or hotp (default totp): ").strip().lower()
+        if otp_type not in ('totp', 'hotp'):
+            otp_type = 'totp'
+        
         # Get secret
         print("\nSecret options:")
         print("1. Enter existing secret")
@@ -58,8 +137,14 @@ class TOTPConsole:
         digits = input("Digits (default 6): ").strip()
         digits = int(digits) if digits.isdigit() else 6
         
-        period = input("Period in seconds (default 30): ").strip()
-        period = int(period) if period.isdigit() else 30
+        period = 30
+        counter = 0
+        if otp_type == 'hotp':
+            counter = input("Initial counter (default 0): ").strip()
+            counter = int(counter) if counter.isdigit() else 0
+        else:
+            period = input("Period in seconds (default 30): ").strip()
+            period = int(period) if period.isdigit() else 30
         
         # Color (hex)
         color_input = input("Display color (hex, default white): ").strip()
@@ -69,31 +154,45 @@ class TOTPConsole:
             color = int(color_input, 16) if color_input else 0xFFFFFF
         except:
             color = 0xFFFFFF
-       # Test the TOTP
+        account = {
+            "id": new_account_id({existing.get('id') for existing in self.accounts}),
+            "name": name,
+            "issuer": issuer,
+            "secret": secret,
+            "digits": digits,
+            "period": period,
+            "color": color
+        }
+        if otp_type == 'hotp':
+            account['type'] = 'hotp'
+            account['counter'] = counter
+        
+        # Test the generator
         try:
-            test_totp = TOTP(secret, digits=digits, interval=period)
-            test_code = test_totp.now()
-            print(f"\nTest TOTP code: {test_code}")
+            test_otp = self.make_otp(account, secret)
+            if otp_type == 'hotp':
+                print(f"\nTest HOTP code (counter {counter}): {test_otp.at(counter)}")
+            else:
+                print(f"\nTest TOTP code: {test_otp.now()}")
             
             # Generate QR code URI
-            uri = test_totp.provisioning_uri(name=name, issuer_name=issuer)
+            if otp_type == 'hotp':
+                uri = test_otp.provisioning_uri(name=name, issuer_name=issuer,
+                                                initial_count=counter)
+            else:
+                uri = test_otp.provisioning_uri(name=name, issuer_name=issuer)
             print(f"QR Code URI: {uri}")
             
         except Exception as e:
-            print(f"Error testing TOTP: {e}")
+            print(f"Error testing {otp_type.upper()}: {e}")
             return
         
         # Confirm addition
         confirm = input("\nAdd this account? (y/N): ").strip().lower()
         if confirm == 'y':
-            account = {
-                "name": name,
-                "issuer": issuer,
-                "secret": secret,
-                "digits": digits,
-                "period": period,
-                "color": color
-            }
+            if not self.seal(account):
+                print("Account not added.")
+                return
             self.accounts.append(account)
             self.save_config()
             print("Account added successfully!")
@@ -113,9 +212,7 @@ class TOTPConsole:
             
             # Generate current code
             try:
-                totp = TOTP(account['secret'], digits=account['digits'], 
-                           interval=account['period'])
-                code = totp.now()
+                code = self.current_code(account)
                 print(f"   Current code: {code}")
             except Exception as e:
                 print(f"   Error: {e}")
@@ -173,6 +270,9 @@ class TOTPConsole:
                 return
             
             otp_type, label = type_label.split('/', 1)
+            if otp_type not in ('totp', 'hotp'):
+                print(f"Unsupported OTP type: {otp_type}")
+                return
             
             # Parse label (issuer:account or just account)
             if ':' in label:
@@ -197,6 +297,7 @@ class TOTPConsole:
             
             # Create account
             account = {
+                "id": new_account_id({existing.get('id') for existing in self.accounts}),
                 "name": name,
                 "issuer": issuer,
                 "secret": params['secret'],
@@ -204,17 +305,22 @@ class TOTPConsole:
                 "period": int(params.get('period', 30)),
                 "color": 0xFFFFFF
             }
+            if otp_type == 'hotp':
+                account['type'] = 'hotp'
+                account['counter'] = int(params.get('counter', 0))
             
             # Test the account
-            totp = TOTP(account['secret'], digits=account['digits'], 
-                       interval=account['period'])
-            test_code = totp.now()
+            otp = self.make_otp(account, account['secret'])
+            if otp_type == 'hotp':
+                test_code = otp.at(account['counter'])
+            else:
+                test_code = otp.now()
             
             print(f"Parsed account: {issuer}: {name}" if issuer else f"Parsed account: {name}")
             print(f"Test code: {test_code}")
             
             confirm = input("Import this account? (y/N): ").strip().lower()
-            if confirm == 'y':
+            if confirm == 'y' and self.seal(account):
                 self.accounts.append(account)
                 self.save_config()
                 print("Account imported successfully!")
@@ -223,20 +329,51 @@ class TOTPConsole:
             print(f"Error parsing URI: {e}")
     
     def export_backup(self):
-        """Export configuration as backup"""
+        """Append changed accounts to the backup journal, or start a full one"""
         if not self.accounts:
             print("No accounts to export.")
             return
         
-        backup_file = "/totp_backup.json"
+        backup_file = cpyota_backup.backup_path()
+        vault_header = self.vault.header if self.vault is not None else None
+        full = input("Full backup instead of incremental? (y/N): ").strip().lower() == 'y'
         try:
-            with open(backup_file, 'w') as f:
-                json.dump({"accounts": self.accounts}, f, indent=2)
-            print(f"Backup saved to {backup_file}")
-            print("WARNING: This file contains secrets! Keep it secure.")
+            if full:
+                written = cpyota_backup.write_full(self.accounts, vault_header, backup_file)
+                print(f"Full backup of {written} accounts saved to {backup_file}")
+            else:
+                changed, deleted = cpyota_backup.write_increment(self.accounts, vault_header, backup_file)
+                if not changed and not deleted:
+                    print(f"{backup_file} is already up to date.")
+                    return
+                print(f"Backup saved to {backup_file}: {changed} changed, {deleted} deleted")
+            if self.vault is None:
+                print("WARNING: This file contains secrets! Keep it secure.")
+            else:
+                print("Secrets in the backup stay encrypted with the vault passphrase.")
         except Exception as e:
             print(f"Error creating backup: {e}")
     
+    def restore_backup(self):
+        """Replace the accounts with the merged backup journal"""
+        backup_file = input(f"Backup file (default {cpyota_backup.backup_path()}): ").strip()
+        try:
+            accounts, vault_header = cpyota_backup.restore(backup_file or None)
+        except (OSError, ValueError) as e:
+            print(f"Error reading backup: {e}")
+            return
+        
+        print(f"Backup holds {len(accounts)} accounts.")
+        confirm = input("Replace current accounts with the backup? (y/N): ").strip().lower()
+        if confirm != 'y':
+            print("Restore cancelled.")
+            return
+        # Sealed records only open with the vault they were sealed under
+        self.vault = SecretVault(vault_header) if vault_header is not None else None
+        self.accounts = accounts
+        self.save_config()
+        print("Backup restored!")
+    
     def show_menu(self):
         """Display main menu"""
         print("\n" + "="*40)
@@ -249,6 +386,9 @@ class TOTPConsole:
         print("5. Export backup")
         print("6. Generate random secret")
         print("7. Test TOTP code")
+        print("8. Encrypt secrets")
+        print("9. Benchmark vault")
+        print("r. Restore backup")
         print("0. Exit")
         print("="*40)
     
@@ -261,6 +401,34 @@ class TOTPConsole:
         print(f"Generated secret: {secret}")
         print("Save this secret securely!")
     
+    def encrypt_secrets(self):
+        """Move plaintext secrets into an encrypted vault"""
+        if self.vault is not None:
+            print("Secrets are already encrypted.")
+            return
+        
+        passphrase = input("New vault passphrase: ")
+        if not passphrase or passphrase != input("Repeat passphrase: "):
+            print("Passphrases are empty or do not match.")
+            return
+        
+        iterations = input(f"KDF iterations (default {DEFAULT_ITERATIONS}): ").strip()
+        iterations = int(iterations) if iterations.isdigit() else DEFAULT_ITERATIONS
+        
+        print("Deriving key...")
+        self.vault = SecretVault.create(passphrase, iterations)
+        self.vault.seal_accounts(self.accounts)
+        self.save_config()
+        print(f"Encrypted {len(self.accounts)} secrets.")
+        print("Set TOTP_PASSPHRASE in settings.toml to unlock at boot.")
+        print("Note: anyone who can read settings.toml can read the passphrase too.")
+    
+    def benchmark_vault(self):
+        """Time vault unlock and per-page decryption on this device"""
+        from cpyota_vault import benchmark
+        iterations = self.vault.header['iterations'] if self.vault else DEFAULT_ITERATIONS
+        benchmark(iterations=iterations)
+    
     def test_totp(self):
         """Test a TOTP code"""
         secret = input("Enter secret: ").strip()
@@ -308,6 +476,12 @@ class TOTPConsole:
                     self.generate_secret()
                 elif choice == '7':
                     self.test_totp()
+                elif choice == '8':
+                    self.encrypt_secrets()
+                elif choice == '9':
+                    self.benchmark_vault()
+                elif choice == 'r':
+                    self.restore_backup()
                 elif choice == '0':
                     print("Goodbye!")
                     break
@@ -0,0 +1,94 @@
+"""
+Build the web UI asset served by TOTPWebServer
+Minifies cpyota.html and writes it (optionally also gzipped) for copying to
+the device's /www directory, where the server streams it from flash.
+
+    python tools/build_web_asset.py              # www/index.html
+    python tools/build_web_asset.py --gzip       # www/index.html and www/index.html.gz
+"""
+import argparse
+import gzip
+import os
+import re
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def minify(html):
+    """Conservative minification that keeps the page's script semantics
+
+    Comments, indentation and blank lines are removed, and CSS whitespace is
+    collapsed. Line breaks inside <script> are kept so statements relying on
+    automatic semicolon insertion still parse.
+    """
+    html = re.sub(r"<!--.*?-->", "", html, flags=re.S)
+
+    def css(match):
+        body = re.sub(r"/\*.*?\*/", "", match.group(2), flags=re.S)
+        body = re.sub(r"\s+", " ", body)
+        body = re.sub(r"\s*([{};:,>])\s*", r"\1", body)
+        return match.group(1) + body.replace(";}", "}").strip() + match.group(3)
+
+    def script(match):
+        lines = []
+        for line in match.group(2).splitlines():
+            line = line.strip()
+            if line and not line.startswith("//"):
+                lines.append(line)
+        return match.group(1) + "\n".join(lines) + match.group(3)
+
+    html = re.sub(r"(<style[^>]*>)(.*?)(</style>)", css, html, flags=re.S)
+    html = re.sub(r"(<script[^>]*>)(.*?)(</script>)", script, html, flags=re.S)
+
+    # Outside scripts, markup indentation and blank lines carry no meaning
+    parts = re.split(r"(<script[^>]*>.*?</script>)", html, flags=re.S)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r">\s+<", "><", parts[i])
+        parts[i] = re.sub(r"\s*\n\s*", " ", parts[i]).strip()
+    return "".join(parts) + "\n"
+
+
+def build(source, output_dir, compress=False):
+    """Write the asset(s) and return [(path, size in bytes)]
+
+    index.html is always written, for clients that don't accept gzip;
+    compress adds index.html.gz from the same build.
+    """
+    with open(source, "r", encoding="utf-8") as f:
+        data = minify(f.read()).encode("utf-8")
+
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = [("index.html", data)]
+    if compress:
+        # mtime=0 keeps the output reproducible
+        outputs.append(("index.html.gz", gzip.compress(data, compresslevel=9, mtime=0)))
+    else:
+        stale = os.path.join(output_dir, "index.html.gz")
+        if os.path.exists(stale):
+            # The server prefers the gzipped file; never leave an old one behind
+            os.remove(stale)
+
+    written = []
+    for name, content in outputs:
+        path = os.path.join(output_dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        written.append((path, len(content)))
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--source", default=os.path.join(ROOT, "cpyota.html"))
+    parser.add_argument("--output", default=os.path.join(ROOT, "www"))
+    parser.add_argument("--gzip", action="store_true", help="also write index.html.gz")
+    args = parser.parse_args()
+
+    original = os.path.getsize(args.source)
+    for path, size in build(args.source, args.output, args.gzip):
+        print(f"{args.source} ({original} bytes) -> {path} ({size} bytes)")
+    print("Copy the www directory to the root of the CIRCUITPY drive.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Push one TOTP configuration to many devices in parallel
+Uploads through POST /upload_config with per-device retries and backoff,
+verifies each device through GET /status, and prints a summary table.
+
+    python tools/fleet_push.py --config fleet.json 10.0.0.21 10.0.0.22:8080
+    python tools/fleet_push.py --config fleet.json --devices-file devices.txt --workers 8
+    python tools/fleet_push.py --config fleet.json --standins 24
+"""
+import argparse
+import email.utils
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+RETRY_STATUSES = (408, 429, 500, 503)  # 408: the upload missed the device's read deadline
+
+
+class PushError(Exception):
+    def __init__(self, message, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delay or HTTP-date), else None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def request(url, data=None, timeout=10):
+    """Make a request and return the decoded JSON body"""
+    headers = {"Content-Type": "application/json"} if data is not None else {}
+    req = urllib.request.Request(url, data=data, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        raise PushError(f"HTTP {e.code}", e.code in RETRY_STATUSES,
+                        parse_retry_after(e.headers.get("Retry-After")))
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        raise PushError(str(getattr(e, "reason", e)))
+
+
+def push_device(address, payload, expected, retries, backoff, timeout):
+    """Upload to one device and confirm it; returns a result dict"""
+    base = address if address.startswith("http") else f"http://{address}"
+    started = time.perf_counter()
+    attempt = 0
+    error = None
+
+    while attempt <= retries:
+        attempt += 1
+        try:
+            request(f"{base}/upload_config", payload, timeout)
+            status = request(f"{base}/status", timeout=timeout)
+            configured = status.get("accounts_configured")
+            if configured != expected:
+                raise PushError(f"device reports {configured} accounts, expected {expected}")
+            return {"device": address, "ok": True, "attempts": attempt, "accounts": configured,
+                    "seconds": time.perf_counter() - started, "error": ""}
+        except PushError as e:
+            error = e
+            if not e.retryable or attempt > retries:
+                break
+            # Exponential backoff, or what the device asked for
+            time.sleep(e.retry_after or backoff * (2 ** (attempt - 1)))
+
+    return {"device": address, "ok": False, "attempts": attempt, "accounts": None,
+            "seconds": time.perf_counter() - started, "error": str(error)}
+
+
+def push_fleet(devices, config, workers=8, retries=3, backoff=0.5, timeout=10):
+    """Push to every device with a bounded pool; returns (results, seconds)"""
+    payload = json.dumps(config).encode("utf-8")
+    expected = len(config["accounts"])
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(
+            lambda device: push_device(device, payload, expected, retries, backoff, timeout),
+            devices))
+    return results, time.perf_counter() - started
+
+
+def start_standins(count):
+    """Local TOTPWebServer instances, each with its own config directory"""
+    from loadtest import start_server
+    servers = [start_server(tempfile.mkdtemp(prefix="cpyota-fleet-")) for _ in range(count)]
+    return servers, [f"127.0.0.1:{server.port}" for server in servers]
+
+
+def print_summary(results, elapsed):
+    width = max(len("device"), *(len(r["device"]) for r in results))
+    print(f"{'device':<{width}}  {'result':<7}{'tries':>6}{'accounts':>10}{'time s':>9}  error")
+    for r in results:
+        accounts = "-" if r["accounts"] is None else r["accounts"]
+        print(f"{r['device']:<{width}}  {'ok' if r['ok'] else 'FAILED':<7}{r['attempts']:>6}"
+              f"{accounts:>10}{r['seconds']:>9.2f}  {r['error']}")
+    ok = sum(1 for r in results if r["ok"])
+    print(f"\n{ok}/{len(results)} devices updated in {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("devices", nargs="*", help="device address (host or host:port)")
+    parser.add_argument("--config", required=True, help="JSON file with an 'accounts' list")
+    parser.add_argument("--devices-file", help="file with one device address per line")
+    parser.add_argument("--standins", type=int, default=0, help="also push to N local stand-in servers")
+    parser.add_argument("--workers", type=int, default=8, help="devices pushed concurrently")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=0.5, help="first retry delay in seconds")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config.get("accounts"), list):
+        parser.error("config must contain an 'accounts' list")
+
+    devices = list(args.devices)
+    if args.devices_file:
+        with open(args.devices_file, "r", encoding="utf-8") as f:
+            devices += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    servers = []
+    if args.standins:
+        servers, addresses = start_standins(args.standins)
+        devices += addresses
+    if not devices:
+        parser.error("no devices given")
+
+    try:
+        results, elapsed = push_fleet(devices, config, args.workers, args.retries,
+                                      args.backoff, args.timeout)
+    finally:
+        for server in servers:
+            server.stop()
+
+    print_summary(results, elapsed)
+    sys.exit(0 if all(r["ok"] for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+"""
+Headless framebuffer renderer for TOTPAuthenticator
+Installs host stand-ins for displayio, terminalio, adafruit_display_text and
+adafruit_display_shapes, runs the real display code against a simulated
+clock and rasterizes every display.refresh() into an RGB framebuffer.
+Consecutive frames are diffed to report changed pixels and dirty area.
+
+    python tools/headless_display.py --accounts 3 --seconds 35
+    python tools/headless_display.py --check            # compare golden frames
+    python tools/headless_display.py --update-golden --dump frames/
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden_frames.json")
+WIDTH = 240
+HEIGHT = 135
+START_TIME = 1700000010  # UNIX time of the first frame, at the start of a 30 s step
+CELL_WIDTH = 6  # terminalio cell; Terminus glyphs fill it, spacing included
+CELL_HEIGHT = 12
+# terminalio.FONT glyphs, ASCII 0x20-0x7E, from Terminus ter-u12n.bdf as shipped
+# with CircuitPython and Blinka displayio (SIL OFL 1.1, (c) 2018 Dimitar Toshkov
+# Zhekov). Twelve row bytes per glyph, top row first, leftmost pixel in bit 7.
+TERMINUS_6X12 = bytes.fromhex(
+    "000000000000000000000000" "000020202020200020200000" "005050500000000000000000"
+    "00005050f85050f850500000" "00002070a8a07028a8702000" "000048a85010202854480000"
+    "000020505020689090680000" "002020200000000000000000" "000010204040404020100000"
+    "000040201010101020400000" "000000005020f82050000000" "000000002020f82020000000"
+    "000000000000000020204000" "000000000000f80000000000" "000000000000000020200000"
+    "000008081010202040400000" "0000708898a8c88888700000" "000020602020202020700000"
+    "000070888808102040f80000" "000070880830080888700000" "00000818284888f808080000"
+    "0000f88080f0080888700000" "0000708080f0888888700000" "0000f8080810102020200000"
+    "000070888870888888700000" "000070888888780808700000" "000000002020000020200000"
+    "000000002020000020204000" "000000081020402010080000" "00000000f80000f800000000"
+    "000000402010081020400000" "000070888810200020200000" "0000708898a8a89880780000"
+    "000070888888f88888880000" "0000f08888f0888888f00000" "000070888080808088700000"
+    "0000e0908888888890e00000" "0000f88080f0808080f80000" "0000f88080f0808080800000"
+    "000070888080b88888700000" "0000888888f8888888880000" "000070202020202020700000"
+    "000038101010109090600000" "00008890a0c0c0a090880000" "000080808080808080f80000"
+    "000088d8a8a8888888880000" "00008888c8a8988888880000" "000070888888888888700000"
+    "0000f0888888f08080800000" "0000708888888888a8700800" "0000f0888888f0a090880000"
+    "000070888070080888700000" "0000f8202020202020200000" "000088888888888888700000"
+    "000088888850505020200000" "000088888888a8a8d8880000" "000088885020205088880000"
+    "000088885050202020200000" "0000f8081020408080f80000" "000070404040404040700000"
+    "000040402020101008080000" "000070101010101010700000" "002050880000000000000000"
+    "00000000000000000000f800" "402000000000000000000000" "000000007008788888780000"
+    "00008080f088888888f00000" "000000007088808088700000" "000008087888888888780000"
+    "000000007088f88080780000" "000018207020202020200000" "000000007888888888780870"
+    "00008080f088888888880000" "002020006020202020700000" "000808001808080808084830"
+    "000040404850606050480000" "000060202020202020700000" "00000000f0a8a8a8a8a80000"
+    "00000000f088888888880000" "000000007088888888700000" "00000000f088888888f08080"
+    "000000007888888888780808" "00000000b8c0808080800000" "000000007880700808f00000"
+    "000020207020202020180000" "000000008888888888780000" "000000008888505020200000"
+    "000000008888a8a8a8700000" "000000008850202050880000" "000000008888888888780870"
+    "00000000f810204080f80000" "000018202040202020180000" "000020202020202020200000"
+    "000060101008101010600000" "0048a8900000000000000000"
+)
+
+
+# --- Stand-ins for the CircuitPython display stack ---------------------------
+
+class Group(list):
+    """displayio.Group: an ordered list of drawables with an offset and scale"""
+
+    def __init__(self, x=0, y=0, scale=1):
+        super().__init__()
+        self.x = x
+        self.y = y
+        self.scale = scale
+        self.hidden = False
+
+
+class Rect:
+    """adafruit_display_shapes.rect.Rect (fill and outline only)"""
+
+    def __init__(self, x, y, width, height, fill=None, outline=None, stroke=1):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.fill = fill
+        self.outline = outline
+        self.stroke = stroke
+
+    def state(self):
+        return ("rect", self.x, self.y, self.width, self.height, self.fill, self.outline, self.stroke)
+
+    def bounds(self):
+        return self.x, self.y, self.width, self.height
+
+    def draw(self, frame, dx, dy):
+        if self.fill is not None:
+            frame.fill(dx + self.x, dy + self.y, self.width, self.height, self.fill)
+        if self.outline is not None:
+            s = self.stroke
+            frame.fill(dx + self.x, dy + self.y, self.width, s, self.outline)
+            frame.fill(dx + self.x, dy + self.y + self.height - s, self.width, s, self.outline)
+            frame.fill(dx + self.x, dy + self.y, s, self.height, self.outline)
+            frame.fill(dx + self.x + self.width - s, dy + self.y, s, self.height, self.outline)
+
+
+class TerminalFont:
+    """terminalio.FONT; only the cell size is asked for"""
+
+    def get_bounding_box(self):
+        return (CELL_WIDTH, CELL_HEIGHT, 0, -2)
+
+
+class Label:
+    """adafruit_display_text.label.Label; (x, y) is the left edge and the
+    vertical centre of the first line, as in the library"""
+
+    def __init__(self, font, text="", color=0xFFFFFF, x=0, y=0, scale=1, **kwargs):
+        self.font = font
+        self.text = text
+        self.color = color
+        self.x = x
+        self.y = y
+        self.scale = scale
+
+    def state(self):
+        return ("label", self.text, self.color, self.x, self.y, self.scale)
+
+    def bounds(self):
+        lines = self.text.split("\n")
+        top = self.y - CELL_HEIGHT * self.scale // 2
+        return (self.x, top, CELL_WIDTH * self.scale * max(len(line) for line in lines),
+                CELL_HEIGHT * self.scale * len(lines))
+
+    def draw(self, frame, dx, dy):
+        s = self.scale
+        top = dy + self.y - CELL_HEIGHT * s // 2
+        for line in self.text.split("\n"):
+            left = dx + self.x
+            for char in line:
+                code = ord(char) - 0x20
+                if not 0 <= code < len(TERMINUS_6X12) // CELL_HEIGHT:
+                    code = ord("?") - 0x20
+                for row in range(CELL_HEIGHT):
+                    bits = TERMINUS_6X12[code * CELL_HEIGHT + row]
+                    for column in range(CELL_WIDTH):
+                        if bits >> (7 - column) & 1:
+                            frame.fill(left + column * s, top + row * s, s, s, self.color)
+                left += CELL_WIDTH * s
+            top += CELL_HEIGHT * s
+
+
+class Framebuffer:
+    """RGB888 pixels in a bytearray"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(width * height * 3)
+
+    def fill(self, x, y, width, height, color):
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self.width, x + width), min(self.height, y + height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        run = bytes(((color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF)) * (x1 - x0)
+        for row in range(y0, y1):
+            start = (row * self.width + x0) * 3
+            self.pixels[start:start + len(run)] = run
+
+    def digest(self):
+        return hashlib.sha256(self.pixels).hexdigest()
+
+    def write_ppm(self, path):
+        with open(path, "wb") as f:
+            f.write(f"P6\n{self.width} {self.height}\n255\n".encode())
+            f.write(self.pixels)
+
+
+def diff_frames(before, after):
+    """(changed pixels, bounding box of the changes or None)"""
+    width = after.width
+    stride = width * 3
+    changed = 0
+    box = None
+    for row in range(after.height):
+        start = row * stride
+        old = before.pixels[start:start + stride]
+        new = after.pixels[start:start + stride]
+        if old == new:
+            continue
+        first = last = None
+        for column in range(width):
+            i = column * 3
+            if old[i:i + 3] != new[i:i + 3]:
+                changed += 1
+                if first is None:
+                    first = column
+                last = column
+        if box is None:
+            box = [first, row, last, row]
+        else:
+            box = [min(box[0], first), box[1], max(box[2], last), row]
+    return changed, box
+
+
+def union_area(rects, width, height):
+    """Pixels covered by a set of (x, y, w, h) rectangles, clipped to the screen"""
+    covered = bytearray(width * height)
+    for x, y, w, h in rects:
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(width, x + w), min(height, y + h)
+        for row in range(y0, y1):
+            covered[row * width + x0:row * width + x1] = b"\x01" * max(0, x1 - x0)
+    return sum(covered)
+
+
+def walk(group, dx=0, dy=0):
+    """Yield (drawable, x offset, y offset) in drawing order"""
+    for item in group:
+        if isinstance(item, Group):
+            if not item.hidden:
+                yield from walk(item, dx + item.x, dy + item.y)
+        else:
+            yield item, dx, dy
+
+
+class HeadlessDisplay:
+    """board.DISPLAY stand-in; every refresh() renders and records one frame"""
+
+    def __init__(self, width=WIDTH, height=HEIGHT):
+        self.width = width
+        self.height = height
+        self.auto_refresh = True
+        self.root_group = None
+        self.frame = Framebuffer(width, height)
+        self.elements = {}  # id -> (drawable, state, bounds) from the last frame
+        self.frames = []
+
+    def show(self, group):
+        self.root_group = group
+
+    def refresh(self, **kwargs):
+        frame = Framebuffer(self.width, self.height)
+        elements = {}
+        dirty = []
+        for item, dx, dy in walk(self.root_group or []):
+            item.draw(frame, dx, dy)
+            x, y, w, h = item.bounds()
+            bounds = (x + dx, y + dy, w, h)
+            state = item.state()
+            elements[id(item)] = (item, state, bounds)
+            previous = self.elements.get(id(item))
+            # displayio redraws anything added, removed or changed
+            if previous is None or previous[0] is not item or previous[1:] != (state, bounds):
+                dirty.append(bounds)
+                if previous is not None and previous[0] is item:
+                    dirty.append(previous[2])
+        for key, (item, state, bounds) in self.elements.items():
+            if elements.get(key, (None,))[0] is not item:
+                dirty.append(bounds)
+
+        changed, box = diff_frames(self.frame, frame)
+        self.frames.append({
+            "changed_pixels": changed,
+            "changed_box_area": 0 if box is None else (box[2] - box[0] + 1) * (box[3] - box[1] + 1),
+            "dirty_area": union_area(dirty, self.width, self.height),
+            "digest": frame.digest(),
+        })
+        self.frame = frame
+        self.elements = elements
+
+
+def install_stubs(display):
+    """Register the stand-in modules TOTPAuthenticator imports"""
+    if "board" in sys.modules:
+        sys.modules["board"].DISPLAY = display
+        return
+
+    def module(name, **attrs):
+        mod = types.ModuleType(name)
+        mod.__dict__.update(attrs)
+        sys.modules[name] = mod
+        return mod
+
+    module("board", DISPLAY=display)  # no IO0: the button is not simulated
+    module("displayio", Group=Group)
+    module("terminalio", FONT=TerminalFont())
+    label = module("adafruit_display_text.label", Label=Label)
+    module("adafruit_display_text", label=label)
+    rect = module("adafruit_display_shapes.rect", Rect=Rect)
+    module("adafruit_display_shapes", rect=rect)
+    module("storage")
+    module("digitalio")
+
+    class TFTBlinky:
+        def blink(self, **kwargs):
+            pass
+    module("tftblinky", TFTBlinky=TFTBlinky)
+
+    try:
+        import pyotp_circuitpython  # noqa: F401
+    except ImportError:
+        # Only random_base32 is needed once cpyota_otp generates the codes
+        module("pyotp_circuitpython",
+               random_base32=lambda length=32: "A" * length)
+
+
+class DeviceFS:
+    """Maps the device's absolute paths into a host directory"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, path):
+        return os.path.join(self.root, path.lstrip("/")) if path.startswith("/") else path
+
+    def open(self, path, *args, **kwargs):
+        return open(self.path(path), *args, **kwargs)
+
+    def listdir(self, path="/"):
+        return os.listdir(self.path(path))
+
+    def remove(self, path):
+        os.remove(self.path(path))
+
+    def rename(self, old, new):
+        os.replace(self.path(old), self.path(new))
+
+    def __getattr__(self, name):
+        return getattr(os, name)
+
+
+class SimClock:
+    """Drives both the TimeSync-style clock and the module's time functions"""
+
+    def __init__(self, start):
+        self.unix = float(start)
+        self.tick = 1000.0
+
+    def advance(self, seconds):
+        self.unix += seconds
+        self.tick += seconds
+
+    # TimeSync interface
+    def now(self):
+        return int(self.unix)
+
+    def trusted(self):
+        return True
+
+    def state(self):
+        return "synced"
+
+    # time module subset used by cpyota_main
+    def monotonic(self):
+        return self.tick
+
+    def time(self):
+        return self.unix
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+
+def make_accounts(count):
+    return [{
+        "id": f"i{i}",
+        "name": f"user{i}@example.com",
+        "issuer": ("GitHub", "Google", "AWS", "Bank", "Mail")[i % 5],
+        "secret": "JBSWY3DPEHPK3PXP" + "ABCDEFGHIJKLMNOP"[i % 16] * 16,
+        "digits": 6,
+        "period": 30,
+        "color": (0x00FF00, 0x00AAFF, 0xFFAA00, 0xFF4444, 0xFFFFFF)[i % 5],
+    } for i in range(count)]
+
+
+def start_app(accounts, start=START_TIME, width=WIDTH, height=HEIGHT):
+    """Build a TOTPAuthenticator on the headless display; returns (app, display, clock)"""
+    display = HeadlessDisplay(width, height)
+    install_stubs(display)
+    import cpyota_main
+    import cpyota_counters
+
+    fs = DeviceFS(tempfile.mkdtemp(prefix="cpyota-headless-"))
+    for mod in (cpyota_main, cpyota_counters):
+        mod.open = fs.open
+        mod.os = fs
+    clock = SimClock(start)
+    cpyota_main.time = clock
+    cpyota_main.print = lambda *args, **kwargs: None
+
+    with fs.open("/totp_config.json", "w") as f:
+        json.dump({"accounts": accounts}, f)
+    app = cpyota_main.TOTPAuthenticator(clock=clock)
+    return app, display, clock
+
+
+def run_ticks(accounts, seconds, step=1.0):
+    """Run update_display() over simulated time; returns the recorded frames"""
+    app, display, clock = start_app(make_accounts(accounts))
+    app.last_update = clock.monotonic()
+    app.last_page_change = clock.monotonic()
+    for _ in range(int(seconds / step)):
+        clock.advance(step)
+        app.update_display()
+    return display.frames
+
+
+def golden_frames(dump=None):
+    """Digest of the first frame for each layout"""
+    digests = {}
+    for name, count in (("one", 1), ("two", 2), ("three", 3)):
+        app, display, clock = start_app(make_accounts(count))
+        digests[name] = display.frames[-1]["digest"]
+        if dump:
+            os.makedirs(dump, exist_ok=True)
+            display.frame.write_ppm(os.path.join(dump, f"{name}.ppm"))
+    return digests
+
+
+def print_ticks(frames, width=WIDTH, height=HEIGHT):
+    screen = width * height
+    print(f"{'tick':>5}{'changed px':>12}{'change box':>12}{'dirty area':>12}{'dirty %':>9}")
+    # The first frame is the initial full draw
+    for i, frame in enumerate(frames[1:], 1):
+        print(f"{i:>5}{frame['changed_pixels']:>12}{frame['changed_box_area']:>12}"
+              f"{frame['dirty_area']:>12}{frame['dirty_area'] / screen:>9.1%}")
+    ticks = frames[1:]
+    if not ticks:
+        return
+    changed = sum(f["changed_pixels"] for f in ticks) / len(ticks)
+    dirty = sum(f["dirty_area"] for f in ticks) / len(ticks)
+    print(f"\nMean per tick: {changed:.0f} changed pixels, {dirty:.0f} px dirty "
+          f"({dirty / screen:.1%} of screen, {dirty * 2 / 1024:.1f} KB at 16 bpp)")
+    print(f"Dirty area / changed pixels: {dirty / changed:.1f}x" if changed else
+          "No pixels changed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=3, help="accounts in the simulated config")
+    parser.add_argument("--seconds", type=float, default=35.0, help="simulated run time")
+    parser.add_argument("--check", action="store_true", help="compare layouts against the golden frames")
+    parser.add_argument("--update-golden", action="store_true", help="rewrite the golden frame digests")
+    parser.add_argument("--dump", help="directory to write each layout as a PPM image")
+    parser.add_argument("--json", action="store_true", help="print per-tick results as JSON")
+    args = parser.parse_args()
+
+    if args.check or args.update_golden or args.dump:
+        digests = golden_frames(args.dump)
+        if args.update_golden:
+            with open(GOLDEN_FILE, "w", encoding="utf-8") as f:
+                json.dump(digests, f, indent=2, sort_keys=True)
+                f.write("\n")
+            print(f"Wrote {len(digests)} golden frames to {GOLDEN_FILE}")
+        if args.check:
+            with open(GOLDEN_FILE, "r", encoding="utf-8") as f:
+                golden = json.load(f)
+            failed = [name for name in golden if digests.get(name) != golden[name]]
+            for name in golden:
+                print(f"{name:<6} {'ok' if name not in failed else 'CHANGED'}")
+            sys.exit(1 if failed else 0)
+        return
+
+    frames = run_ticks(args.accounts, args.seconds)
+    if args.json:
+        print(json.dumps(frames, indent=2))
+    else:
+        print_ticks(frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Load-test harness for TOTPWebServer
+Runs the device web server on localhost under CPython (with micropython.const
+and gc.mem_free stubbed) and drives a mix of GET /, GET /status and
+POST /upload_config at several concurrency levels and upload sizes.
+
+    python tools/loadtest.py --concurrency 1,4,16 --requests 400
+    python tools/loadtest.py --mix index=1,status=4,upload=1 --accounts 5,50,100
+
+Reports requests per second, p50/p95/p99 latency, error and truncation rates,
+and the peak Python allocation per request inside the server.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def install_stubs():
+    """Provide the CircuitPython-only names the server module needs"""
+    if "micropython" not in sys.modules:
+        micropython = types.ModuleType("micropython")
+        micropython.const = lambda value: value
+        sys.modules["micropython"] = micropython
+    if not hasattr(gc, "mem_free"):
+        gc.mem_free = lambda: 0
+
+
+def start_server(workdir, quiet=True, compress=False, **kwargs):
+    """Start a TOTPWebServer on an ephemeral localhost port in a thread"""
+    install_stubs()
+    import cpyota_serv
+    from build_web_asset import build
+
+    if quiet:
+        cpyota_serv.print = lambda *args, **kw: None
+
+    server = cpyota_serv.TOTPWebServer(port=0, **kwargs)
+    server.config_file = os.path.join(workdir, "totp_config.json")
+    server.temp_file = os.path.join(workdir, "totp_temp.json")
+    server.asset_dir = os.path.join(workdir, "www")
+    build(os.path.join(ROOT, "cpyota.html"), server.asset_dir, compress)
+
+    # Run the server's own loop so its pacing is part of what gets measured
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    deadline = time.time() + 5
+    while not server.running:
+        if time.time() > deadline or not thread.is_alive():
+            raise RuntimeError("Server failed to start")
+        time.sleep(0.01)
+    return server
+
+
+def make_config(accounts):
+    return {"accounts": [{
+        "name": f"Account {i}",
+        "issuer": f"Issuer {i % 7}",
+        "secret": "JBSWY3DPEHPK3PXP" * 2,
+        "digits": 6,
+        "period": 30,
+        "color": 0xFFFFFF
+    } for i in range(accounts)]}
+
+
+def build_requests(accounts):
+    """Raw request bytes for each request kind"""
+    body = json.dumps(make_config(accounts)).encode("utf-8")
+    return {
+        "index": b"GET / HTTP/1.1\r\nHost: device\r\nAccept-Encoding: gzip\r\n\r\n",
+        "status": b"GET /status HTTP/1.1\r\nHost: device\r\n\r\n",
+        "upload": (b"POST /upload_config HTTP/1.1\r\nHost: device\r\n"
+                   b"Content-Type: application/json\r\n"
+                   b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body),
+    }
+
+
+def send_request(port, raw, timeout):
+    """Send one request; returns (status, latency seconds, truncated)"""
+    started = time.perf_counter()
+    sock = socket.create_connection(("127.0.0.1", port), timeout=timeout)
+    try:
+        sock.sendall(raw)
+        chunks = []
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    latency = time.perf_counter() - started
+
+    response = b"".join(chunks)
+    head, _, body = response.partition(b"\r\n\r\n")
+    if not head:
+        return None, latency, True
+    status = int(head.split(b" ", 2)[1])
+    length = None
+    for line in head.split(b"\r\n")[1:]:
+        key, _, value = line.partition(b":")
+        if key.strip().lower() == b"content-length":
+            length = int(value)
+    truncated = length is not None and len(body) < length
+    return status, latency, truncated
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+def run_level(server, requests, mix, total, concurrency, timeout):
+    """Drive `total` requests with `concurrency` client threads"""
+    port = server.port
+    rejected_before = server.admission.stats['rate_limited'] + server.admission.stats['overloaded']
+    kinds = [kind for kind, weight in mix.items() for _ in range(weight)]
+    plan = [random.choice(kinds) for _ in range(total)]
+    results = []
+
+    def worker(kind):
+        try:
+            status, latency, truncated = send_request(port, requests[kind], timeout)
+            ok = status is not None and status < 400
+            return kind, ok, latency, truncated
+        except OSError:
+            return kind, False, None, False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, plan))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(r[2] for r in results if r[2] is not None)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "rps": total / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "error_rate": sum(1 for r in results if not r[1]) / total,
+        "truncation_rate": sum(1 for r in results if r[3]) / total,
+        "rejected": (server.admission.stats['rate_limited'] + server.admission.stats['overloaded']
+                     - rejected_before),
+    }
+
+
+def measure_allocation(server, port, requests, samples, timeout):
+    """Peak Python allocation inside handle_request, per request kind
+
+    Measured serially in a separate pass so tracing does not skew throughput.
+    tracemalloc sees every thread, so the client only reads each response
+    after the server has finished with the request. Connections refused by
+    admission control never reach handle_request and are skipped.
+    """
+    peaks = []
+    original = server.handle_request
+    stats = server.admission.stats
+
+    def refusals():
+        return stats['rate_limited'] + stats['overloaded']
+
+    def traced(client_socket):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        original(client_socket)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+
+    server.handle_request = traced
+    tracemalloc.start()
+    allocation = {}
+    try:
+        for kind, raw in requests.items():
+            del peaks[:]
+            for sample in range(samples):
+                measured, refused = len(peaks), refusals()
+                try:
+                    sock = socket.create_connection(("127.0.0.1", port), timeout=timeout)
+                except OSError:
+                    continue
+                with sock:
+                    sock.sendall(raw)
+                    deadline = time.time() + timeout
+                    while (len(peaks) == measured and refusals() == refused
+                           and time.time() < deadline):
+                        time.sleep(0.001)
+                    try:
+                        while sock.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+            allocation[kind] = max(peaks) if peaks else None
+    finally:
+        tracemalloc.stop()
+        server.handle_request = original
+    return allocation
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = int(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=300, help="requests per concurrency level")
+    parser.add_argument("--mix", default="index=1,status=3,upload=1", help="kind=weight list")
+    parser.add_argument("--accounts", default="10", help="comma-separated accounts per upload payload")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--alloc-samples", type=int, default=20)
+    parser.add_argument("--gzip", action="store_true", help="serve the gzipped web UI asset")
+    parser.add_argument("--limits", action="store_true",
+                        help="keep the server's admission limits (all clients share 127.0.0.1)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    workdir = tempfile.mkdtemp(prefix="cpyota-load-")
+    server = start_server(workdir, compress=args.gzip)
+    if not args.limits:
+        # Every harness client shares one address; measure raw capacity instead
+        server.admission.rate = server.admission.global_rate = 1e9
+        server.admission.burst = server.admission.global_burst = 1e9
+    unknown = set(mix) - set(build_requests(0))
+    if unknown:
+        parser.error(f"Unknown request kinds: {', '.join(sorted(unknown))}")
+
+    runs = []
+    try:
+        for accounts in args.accounts.split(","):
+            requests = build_requests(int(accounts))
+            levels = [run_level(server, requests, mix, args.requests, int(level), args.timeout)
+                      for level in args.concurrency.split(",")]
+            allocation = measure_allocation(server, server.port, requests, args.alloc_samples, args.timeout)
+            runs.append({"accounts": int(accounts), "levels": levels, "allocation": allocation,
+                         "payload_bytes": {k: len(v) for k, v in requests.items()}})
+    finally:
+        server.stop()
+
+    if args.json:
+        print(json.dumps({"runs": runs}, indent=2))
+        return
+
+    for run in runs:
+        print(f"Mix {args.mix}, upload payload {run['payload_bytes']['upload']} bytes "
+              f"({run['accounts']} accounts)")
+        print(f"{'clients':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>9}{'trunc':>8}{'refused':>9}")
+        for level in run["levels"]:
+            print(f"{level['concurrency']:>8}{level['rps']:>9.1f}{level['p50_ms']:>9.2f}"
+                  f"{level['p95_ms']:>9.2f}{level['p99_ms']:>9.2f}"
+                  f"{level['error_rate']:>8.1%}{level['truncation_rate']:>8.1%}{level['rejected']:>9}")
+        print("Peak server-side allocation per request:")
+        for kind, peak in run["allocation"].items():
+            print(f"  {kind:<8}{peak if peak is not None else 'n/a':>10} bytes")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Local SNTP stand-in for exercising cpyota_timesync on the host
+Answers SNTP client requests on localhost with an optional clock offset,
+so sync, drift tracking and stale-clock handling can be tried without a
+real time server.
+
+    python tools/ntp_standin.py --port 1123 --offset 42.5
+    python tools/ntp_standin.py --check
+"""
+import argparse
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cpyota_timesync import NTP_EPOCH_OFFSET, NTP_PACKET_SIZE, SNTPClient, TimeSync
+
+
+def pack_timestamp(unix_time):
+    """Convert UNIX seconds to a 64-bit NTP timestamp"""
+    ntp_time = unix_time + NTP_EPOCH_OFFSET
+    seconds = int(ntp_time)
+    fraction = int((ntp_time - seconds) * 4294967296)
+    return struct.pack("!II", seconds, fraction)
+
+
+class NTPStandIn:
+    """Minimal SNTP server; offset and drift shift the time it reports"""
+
+    def __init__(self, host="127.0.0.1", port=0, offset=0.0, drift_ppm=0.0, delay=0.0, stratum=1):
+        self.offset = offset
+        self.drift_ppm = drift_ppm
+        self.delay = delay  # seconds to hold each request, to simulate a slow path
+        self.stratum = stratum  # 0 sends kiss-o'-death (RATE) replies
+        self.requests = 0
+        self.started = time.time()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.address = self.sock.getsockname()
+        self.thread = None
+
+    def reported_time(self):
+        elapsed = time.time() - self.started
+        return time.time() + self.offset + elapsed * self.drift_ppm / 1e6
+
+    def serve_forever(self):
+        while True:
+            try:
+                packet, client = self.sock.recvfrom(NTP_PACKET_SIZE)
+            except OSError:
+                return
+            received = self.reported_time()
+            if len(packet) < NTP_PACKET_SIZE:
+                continue
+            if self.delay:
+                time.sleep(self.delay)
+
+            reply = bytearray(NTP_PACKET_SIZE)
+            reply[0] = 0x1C  # LI = 0, VN = 3, Mode = 4 (server)
+            reply[1] = self.stratum
+            if self.stratum == 0:
+                reply[12:16] = b"RATE"
+            reply[24:32] = packet[40:48]  # originate = client transmit
+            reply[32:40] = pack_timestamp(received)
+            reply[40:48] = pack_timestamp(self.reported_time())
+            self.sock.sendto(reply, client)
+            self.requests += 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.sock.close()
+
+
+def check(offset):
+    """Sync a TimeSync against a stand-in and report what it measured"""
+    server = NTPStandIn(offset=offset).start()
+    # The socket module has the subset of the socketpool API SNTPClient uses
+    client = SNTPClient(socket, server.address[0], server.address[1], timeout=2)
+    clock = TimeSync()
+
+    print(f"Stand-in on {server.address[0]}:{server.address[1]} with offset {offset:+.3f}s")
+    print(f"Before sync: state={clock.state()} trusted={clock.trusted()}")
+
+    client.request()
+    result = None
+    while result is None:
+        result = client.poll()
+        time.sleep(0.001)
+    clock.apply(*result)
+
+    error = clock.predict_ns(time.monotonic_ns()) / 1e9 - server.reported_time()
+    print(f"After sync:  state={clock.state()} trusted={clock.trusted()} "
+          f"offset={clock.last_offset:+.3f}s error={error * 1000:+.2f}ms "
+          f"round_trip={result[1] / 1e6:.2f}ms now={clock.now()}")
+
+    # A kiss-o'-death reply must be refused, never applied
+    server.stratum = 0
+    client.request()
+    refused = False
+    while not refused:
+        try:
+            if client.poll() is not None:
+                break
+        except OSError as e:
+            print(f"Stratum 0 reply refused: {e}")
+            refused = True
+        time.sleep(0.001)
+    server.stop()
+    return abs(error) < 0.05 and refused
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1123)
+    parser.add_argument("--offset", type=float, default=0.0, help="seconds added to reported time")
+    parser.add_argument("--drift-ppm", type=float, default=0.0, help="simulated drift of reported time")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to hold each request")
+    parser.add_argument("--stratum", type=int, default=1, help="stratum to report (0 = kiss-o'-death)")
+    parser.add_argument("--check", action="store_true", help="sync once against a private stand-in and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check(args.offset or 42.5) else 1)
+
+    server = NTPStandIn(args.host, args.port, args.offset, args.drift_ppm, args.delay, args.stratum)
+    print(f"SNTP stand-in listening on {server.address[0]}:{server.address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()